@@ -1,5 +1,4 @@
 import gym
-import copy
 from monteCarlo import MCTree
 import numpy as np
 import time
@@ -12,7 +11,7 @@ from acktr.model_loader import nnModel
 
 
 def test(box_size_list, env, obser, simulation_times, search_depth, rollout_length, nmodel, args):
-    sim_env = copy.deepcopy(env)
+    sim_env = env.clone()
     size_idx = len(box_size_list)
     action_list = []
     box_size_distribution = dict()
@@ -27,7 +26,10 @@ def test(box_size_list, env, obser, simulation_times, search_depth, rollout_leng
         print(box_size_list[:10])
         # print(sim_env.space.plain)
         # MCTS simulation
-        pl = mctree.get_policy(simulation_times, zeta=1e-5)
+        if args.search_deadline > 0:
+            pl, _ = mctree.anytime_policy(args.search_deadline, zeta=1e-5)
+        else:
+            pl = mctree.get_policy(simulation_times, zeta=1e-5)
         action = mctree.sample_action(pl)
         
         assert sim_env.next_box == box_size_list[0]
@@ -50,7 +52,8 @@ def test(box_size_list, env, obser, simulation_times, search_depth, rollout_leng
 
         # fetch new box    
         assert size_idx <= len(env.box_creator.box_list)
-        next_box = copy.deepcopy(env.box_creator.box_list[size_idx])
+        # box sizes are never modified, the list can be shared
+        next_box = env.box_creator.box_list[size_idx]
         size_idx += 1
         # update dis
         # tribution
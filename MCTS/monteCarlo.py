@@ -1,5 +1,5 @@
 from node import PutNode
-import copy, time
+import time
 import numpy as np
 
 
@@ -35,7 +35,7 @@ class MCTree(object):
         cur_node = self.root
         cur_depth = 0
         obs = self.observation
-        sim2_env = copy.deepcopy(self.sim_env)
+        sim2_env = self.sim_env.clone()
 
         while True:
             # Terminated: back up
@@ -97,17 +97,36 @@ class MCTree(object):
         return actions_values
 
     def get_policy(self, sim_times, zeta=1):
-        start = time.clock()
+        start = time.perf_counter()
         for i in range(sim_times):
             # print('simulation',i+1)
             self.select()
-        end = time.clock()
+        end = time.perf_counter()
         p = self.play(zeta)
         print('cost time', end-start)
         print("terminated node:", self.subrt)
         print('reached depth:', self.reached_depth)
         return p
 
+    def anytime_policy(self, deadline_ms, zeta=1):
+        """
+        Run simulations until deadline_ms milliseconds have passed and return
+        the policy together with the search telemetry. At least one simulation
+        is run so that the root is expanded.
+        """
+        start = time.perf_counter()
+        deadline = start + deadline_ms / 1000
+        sims = 0
+        while sims == 0 or time.perf_counter() < deadline:
+            self.select()
+            sims += 1
+        end = time.perf_counter()
+        p = self.play(zeta)
+        telemetry = {'simulations': sims, 'reached_depth': self.reached_depth,
+                     'terminated_nodes': self.subrt, 'time': end - start,
+                     'time_per_simulation': (end - start) / sims}
+        return p, telemetry
+
     def sample_action(self, policy):
         if self.max_depth == 0:
             def get_p(key):
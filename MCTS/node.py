@@ -1,5 +1,5 @@
 import numpy as np
-import math, copy, time
+import math, time
 
 
 INF = 1e9+7
@@ -133,7 +133,7 @@ class PutNode(Node):
             self.next_nodes[0] = PutNode(self, 1)
 
         if rollout_length >= 1 and len(box_size_list) >= rollout_length + 1:
-            value = self.roll_out(box_size_list[:rollout_length+1], copy.deepcopy(sim_env), observation, nmodel)
+            value = self.roll_out(box_size_list[:rollout_length+1], sim_env.clone(), observation, nmodel)
         self.value = value
 
     def roll_out(self, box_size_list, sim_env, observation, nmodel, gamma=1):
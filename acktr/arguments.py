@@ -62,6 +62,27 @@ def get_args():
     parser.add_argument(
         '--h_comp', action='store_true', default=False, help='add compensation for the height delta from grid parametrization'
     )
+    parser.add_argument(
+        '--eval_batch', default=1, type=int, help='sequences evaluated in lockstep, their network queries share one forward pass'
+    )
+    parser.add_argument(
+        '--eval_workers', default=0, type=int, help='worker processes that test cases in parallel, 0 tests in the main process'
+    )
+    parser.add_argument(
+        '--search_times', default=100, type=int, help='simulations of the reorder search per placement (default 100)'
+    )
+    parser.add_argument(
+        '--reuse_tree', action='store_true', default=False, help='keep the reorder search tree between placements (needs --search_workers 0)'
+    )
+    parser.add_argument(
+        '--search_workers', default=0, type=int, help='worker processes of the root-parallel reorder search, 0 searches in the main process'
+    )
+    parser.add_argument(
+        '--search_deadline', default=0, type=float, help='time budget of the reorder search per placement in ms, replaces --search_times when > 0 (needs --eval_batch 1)'
+    )
+    parser.add_argument(
+        '--eval_cache', default=0, type=int, help='capacity of the LRU cache of network evaluations used by search, 0 disables it'
+    )
 
     # saving and logging
     parser.add_argument(
@@ -119,6 +140,27 @@ def get_args():
     parser.add_argument(
         '--num_processes', default=16, type=int,  help='how many training CPU processes to use (default: 16)'
     )
+    parser.add_argument(
+        '--seq_producers', default=0, type=int, help='background processes generating cut1/cut2 sequences for training, 0 generates inside the envs'
+    )
+    parser.add_argument(
+        '--seq_queue', default=64, type=int, help='capacity of the queue of generated sequences (default: 64)'
+    )
+    parser.add_argument(
+        '--worker_masks', action='store_true', default=False, help='compute action masks in the env workers and pass them through shared memory'
+    )
+    parser.add_argument(
+        '--compact_obs', action='store_true', default=False, help='observe the next box as 3 numbers instead of 3 planes, the network broadcasts them'
+    )
+    parser.add_argument(
+        '--mask_cache', action='store_true', default=False, help='keep the action masks of the seen box types and recheck only what a placement touches, for large containers'
+    )
+    parser.add_argument(
+        '--batched_env', action='store_true', default=False, help='step all the training bins as arrays in the main process instead of one env process per bin (cut1|cut2)'
+    )
+    parser.add_argument(
+        '--window_stride', default=10, type=int, help='multi_bin: stride of the container-sized windows over the plain (default: 10)'
+    )
     parser.add_argument(
         '--num_steps', default=5, type=int,  help='number of forward steps in A2C (default: 5)'
     )
@@ -153,6 +195,18 @@ def get_args():
         raise Exception('Unknown option \'%s\''%(args.mode))
     if args.item_seq not in ['cut1', 'rs', 'cut2']:
         raise Exception('Unsupported generator \'%s\''%(args.item_seq))
+    if args.seq_producers > 0 and args.item_seq not in ['cut1', 'cut2']:
+        raise Exception('Background generation only supports cut1|cut2')
+    if args.batched_env and args.item_seq not in ['cut1', 'cut2']:
+        raise Exception('The batched env only supports cut1|cut2')
+    if args.batched_env and args.mask_cache:
+        raise Exception('The batched env does not support --mask_cache')
+    if args.search_deadline > 0 and args.eval_batch > 1:
+        # the sequences of a batch search in turns, each one's wall-clock deadline would run during the others' turns
+        raise Exception('--search_deadline does not work with --eval_batch > 1')
+    if args.reuse_tree and args.search_workers > 0:
+        # the workers of the root-parallel search build their subtrees from scratch, there is no tree to keep
+        raise Exception('--reuse_tree does not work with --search_workers > 0')
     
     print("===== PARSED ARGS INFO =====")
     
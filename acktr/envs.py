@@ -8,8 +8,12 @@ from baselines import bench
 from baselines.common.vec_env import VecEnvWrapper
 from baselines.common.vec_env.dummy_vec_env import DummyVecEnv
 from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
+from baselines.common.vec_env.vec_monitor import VecMonitor
 from baselines.common.vec_env.vec_normalize import \
     VecNormalize as VecNormalize_
+from envs.bpp0.streamCreator import StreamBoxCreator
+from envs.bpp0.batched import BatchedPackingGame
+from envs.bpp0.bin3D import make_box_creator
 import sys
 sys.path.append('../')
 
@@ -28,17 +32,20 @@ try:
 except ImportError:
     pass
 
-def make_env(env_id, seed, rank, log_dir, allow_early_resets, args):
+def make_env(env_id, seed, rank, log_dir, allow_early_resets, args, producer=None):
     def _thunk():
         if env_id.startswith("dm"):
             _, domain, task = env_id.split('.')
             env = dm_control2gym.make(domain_name=domain, task_name=task)
         else:
             print()
+            # with a producer the sequences are generated in background processes
+            box_creator = StreamBoxCreator(producer) if producer is not None else None
             env = gym.make(env_id,
                            enable_rotation = args.enable_rotation,
                            box_set = args.box_size_set, container_size = args.container_size, test = False,
-                           data_name = None, data_type = args.data_type)
+                           data_name = None, data_type = args.data_type, box_creator = box_creator,
+                           compact_obs = args.compact_obs, mask_cache = args.mask_cache)
 
         is_atari = hasattr(gym.envs, 'atari') and isinstance(
             env.unwrapped, gym.envs.atari.atari_env.AtariEnv)
@@ -82,12 +89,30 @@ def make_vec_envs(env_name,
                   device,
                   allow_early_resets,
                   num_frame_stack = None,
-                  args = None):
+                  args = None,
+                  worker_masks = False,
+                  producer = None,
+                  batched = False):
+    if batched:
+        # every bin stepped as arrays in this process, VecMonitor keeps the episode stats bench.Monitor keeps per env
+        box_creator = StreamBoxCreator(producer) if producer is not None else \
+            make_box_creator(args.data_type, args.container_size, args.box_size_set, args.enable_rotation)
+        envs = BatchedPackingGame(num_processes, args.container_size, box_creator, args.enable_rotation,
+                                  args.compact_obs)
+        if log_dir is not None:
+            envs = VecMonitor(envs, os.path.join(log_dir, 'batched'))
+        return wrap_vec_envs(envs, gamma, device, num_frame_stack)
+
     envs = [
-        make_env(env_name, seed, i, log_dir, allow_early_resets, args)
+        make_env(env_name, seed, i, log_dir, allow_early_resets, args, producer)
         for i in range(num_processes)
     ]
 
+    # let the workers compute the action masks and share them with the learner
+    mask_len = None
+    if worker_masks:
+        mask_len = args.container_size[0] * args.container_size[1] * (1 + args.enable_rotation)
+
     if len(envs) > 1:
         """
             If you don't specify observation_space, we'll have to create a dummy
@@ -96,14 +121,17 @@ def make_vec_envs(env_name,
         env = gym.make(env_name,
                        enable_rotation=args.enable_rotation,
                        box_set=args.box_size_set, container_size=args.container_size, test = False,
-                       data_name = None)
+                       data_name = None, compact_obs = args.compact_obs, mask_cache = args.mask_cache)
         spaces = [env.observation_space, env.action_space]
-        envs = ShmemVecEnv(envs, spaces, context='fork')
+        envs = ShmemVecEnv(envs, spaces, context='fork', mask_len=mask_len)
 
         # envs = DummyVecEnv(envs)
     else:
-        envs = DummyVecEnv(envs)
+        envs = DummyVecEnv(envs, mask_len=mask_len)
+    return wrap_vec_envs(envs, gamma, device, num_frame_stack)
 
+
+def wrap_vec_envs(envs, gamma, device, num_frame_stack=None):
     if len(envs.observation_space.shape) == 1:
         if gamma is None:
             envs = VecNormalize(envs, ret=False)
@@ -192,6 +220,11 @@ class VecPyTorch(VecEnvWrapper):
         reward = torch.from_numpy(reward).unsqueeze(dim=1).float()
         return obs, reward, done, info
 
+    def get_masks(self):
+        masks = self.venv.get_masks()
+        masks = torch.from_numpy(masks).float().to(self.device)
+        return masks
+
 class VecNormalize(VecNormalize_):
     def __init__(self, *args, **kwargs):
         super(VecNormalize, self).__init__(*args, **kwargs)
@@ -313,8 +313,23 @@ class CNNPro(NNBase):
         self.critic_linear = init_(nn.Linear(hidden_size, 1))
         self.train()
 
+    def expand_inputs(self, inputs):
+        """
+        Compact observations (height map + next box dims) are broadcast to the
+        box planes here, full observations only get reshaped. The layers are
+        the same for both, so checkpoints work with either.
+        """
+        size = self.args.pallet_size
+        area = size * size
+        if inputs.shape[-1] == area + 3:
+            inputs = inputs.reshape((-1, area + 3))
+            hmap = inputs[:, :area].reshape((-1, 1, size, size))
+            box = inputs[:, area:].reshape((-1, 3, 1, 1)).expand(-1, 3, size, size)
+            return torch.cat((hmap, box), dim=1)
+        return inputs.reshape((-1,self.args.channel,size,size))
+
     def forward(self, inputs, rnn_hxs, masks):
-        x = inputs.reshape((-1,self.args.channel,self.args.pallet_size,self.args.pallet_size))
+        x = self.expand_inputs(inputs)
         assert not self.is_recurrent
         share = self.share(x)
         hidden_critic = self.critic(share)
@@ -2,18 +2,73 @@ import numpy as np
 import torch
 import gym
 import copy
+import hashlib
+from collections import OrderedDict
 from acktr.model import Policy
 from acktr.utils import get_rotation_mask, get_possible_position
 
 
+class EvaluationCache(object):
+    """
+    LRU cache of network evaluations. A state is keyed by a digest of its
+    height map plus the next box's dims, so the same state reached through
+    different orders of the preview boxes is only evaluated once.
+    """
+    def __init__(self, capacity):
+        assert capacity > 0
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(obs, area):
+        # obs is a flat float32 observation: the height map followed by one channel per box dim
+        digest = hashlib.blake2b(obs[:area].tobytes(), digest_size=16).digest()
+        return digest, tuple(obs[area::area].tolist())
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {'size': len(self._entries), 'capacity': self.capacity, 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hits / total if total > 0 else 0.0}
+
+
 class nnModel(object):
     def __init__(self, url, args):
         area = args.container_size[0]*args.container_size[1]
         self.alen = area * (1+args.enable_rotation)
         self.olen = args.channel * area
         self.height = args.container_size[2]
+        self.area = area
         self.device = torch.device(args.device)
         self._model = self._load_model(url, args)
+        # LRU cache of evaluations, disabled when the capacity is 0
+        self.cache = EvaluationCache(args.eval_cache) if args.eval_cache > 0 else None
 
 
     def _load_model(self, url, args):
@@ -36,34 +91,63 @@ class nnModel(object):
         return actor_critic
 
     def evaluate(self, obs, use_mask=True):
-        x = copy.deepcopy(obs)
-        x = torch.FloatTensor(x).to(self.device)
+        value, poss_in_actions, _ = self.evaluate_batch([obs], use_mask)
+        value = float(value[0])
+        poss_in_actions = np.reshape(poss_in_actions, newshape=(-1,))
+        return value, poss_in_actions
 
-        value, logits, _, pred= self._model.base(x, 0, 0)
-        poss = self._model.dist.get_policy_distribution(logits)
-        pred = self._model.binary(pred)
-        # pred = get_rotation_mask(torch.tensor(obs), [10,10,10])
-        # pred = np.array(get_possible_position(torch.tensor(obs), [10,10,10]))
+    def evaluate_batch(self, observations, use_mask=True):
+        """
+        Run a batch of observations through the network in one forward pass.
+        Return the values (n,), the action possibilities (n, alen) and the
+        predicted masks (n, alen).
+        """
+        x = np.asarray(observations, dtype=np.float32).reshape((-1, self.olen))
+        if self.cache is None:
+            value, poss_in_actions, pred = self._forward(x)
+        else:
+            value, poss_in_actions, pred = self._cached_forward(x)
+        if use_mask:
+            poss_in_actions = poss_in_actions * pred
+        return value, poss_in_actions, pred
 
-        value = float(value)
-        poss = poss.cpu().detach().numpy()
-        pred = pred.cpu().detach().numpy()
+    def _forward(self, x):
+        x = torch.from_numpy(x).to(self.device)
+        with torch.no_grad():
+            value, logits, _, pred = self._model.base(x, 0, 0)
+            poss = self._model.dist.get_policy_distribution(logits)
+            pred = self._model.binary(pred)
 
-        # np.set_printoptions(precision=3, suppress=True)
-        # print('---------------------------')
-        # print(pred1.reshape(10,10))
-        # print(pred2.reshape(10,10))
+        value = value.cpu().numpy().reshape((-1,))
+        poss = poss.cpu().numpy()
+        pred = pred.cpu().numpy()
 
         def softmax(x):
-            probs = np.exp(x - np.max(x))
-            probs /= np.sum(probs)
+            probs = np.exp(x - np.max(x, axis=-1, keepdims=True))
+            probs /= np.sum(probs, axis=-1, keepdims=True)
             return probs
 
-        poss_in_actions = softmax(poss)
-        if use_mask:
-            poss_in_actions = poss_in_actions * pred
-        poss_in_actions = np.reshape(poss_in_actions, newshape=(-1,))
-        return value, poss_in_actions
+        return value, softmax(poss), pred
+
+    def _cached_forward(self, x):
+        keys = [self.cache.key(o, self.area) for o in x]
+        entries = [self.cache.get(k) for k in keys]
+        # evaluate every missing state once, even if it appears several times in the batch
+        missing = {}
+        for i, (k, e) in enumerate(zip(keys, entries)):
+            if e is None and k not in missing:
+                missing[k] = i
+        if len(missing) > 0:
+            rows = list(missing.values())
+            value, poss, pred = self._forward(x[rows])
+            for j, k in enumerate(missing):
+                self.cache.put(k, (value[j], poss[j].copy(), pred[j].copy()))
+            new_entries = dict(zip(missing, zip(value, poss, pred)))
+            entries = [new_entries[k] if e is None else e for k, e in zip(keys, entries)]
+        value = np.array([e[0] for e in entries])
+        poss = np.stack([e[1] for e in entries])
+        pred = np.stack([e[2] for e in entries])
+        return value, poss, pred
 
     def sample_action(self, obs):
         x = copy.deepcopy(obs)
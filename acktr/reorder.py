@@ -3,6 +3,9 @@ import copy
 import gym
 import math
 import itertools
+import multiprocessing
+import torch
+from time import perf_counter
 
 class Node(object):
     def __init__(self, parent, number, height):
@@ -17,6 +20,11 @@ class Node(object):
         self.dis_num = height
 
         self.visit = 0
+        # network evaluation of the node's state, filled when its parent is expanded
+        self.evaluation = None
+        # reward of placing the node's box, filled when the node is visited
+        self.reward = None
+        self.disabled = False
         if self.height != -1:
             self.max_v = math.factorial(self.height)
         else:
@@ -40,6 +48,7 @@ class Node(object):
 
     def disable(self):
         self.dis_num = 0
+        self.disabled = True
         if self.parent is None:
             return
         self.parent.dis_num -= 1
@@ -56,7 +65,7 @@ class Node(object):
 
 # FOR ENV 'MASK'
 class ReorderTree(object):
-    def __init__(self, nmodel, box_list, env, encode=True, p_bound=0.8, v_bound=0.1, times=100):
+    def __init__(self, nmodel, box_list, env, encode=True, p_bound=0.8, v_bound=0.1, times=100, pool=None):
         self.encode = encode
         # the box number used for reordering
         self.box_num = len(box_list)
@@ -66,13 +75,21 @@ class ReorderTree(object):
         self.mask_shape = env.bin_size[:2]
         self.mask_len = self.mask_shape[0] * self.mask_shape[1]
         # copy the env and box list
-        self.env = copy.deepcopy(env)
+        self.env = env.clone()
         self.box_list = copy.deepcopy(box_list)
         # threshold
         self.p_bound = p_bound
         self.v_bound = v_bound
         self.pos_num = int(1 / self.p_bound)
+        self.max_times = times
         self.times = min(times, math.factorial(self.box_num - 1))
+        # root of the search tree, kept between placements by succeed()
+        self.root = None
+        # SearchPool for root-parallel search, None to search in this process
+        self.pool = pool
+        # statistics of the last search
+        self.reached_depth = 0
+        self.telemetry = None
 
     def get_order_mask(self, smask, box_size):
         emask = copy.deepcopy(smask)
@@ -121,17 +138,28 @@ class ReorderTree(object):
         return ssum == self.mask_len * max_height
         # return rsum > 0.8 * self.mask_len or ssum == self.mask_len * max_height
 
-    def evaluate(self, obs, masks, real_idx):
+    def get_revised_obs(self, obs, masks, real_idx):
         # 4 channels
         revised_obs = copy.deepcopy(obs).reshape(4,-1)
         raw_obs = copy.deepcopy(revised_obs[0])
-        new_obs = self.get_mixed_obs(masks, real_idx, raw_obs)
-        revised_obs[0] = new_obs
-        revised_obs = revised_obs.reshape((-1,))
-        val, poss = self.nmodel.evaluate(revised_obs)
-        pos_candidates = list(np.argsort(poss)[-self.pos_num:])
-        wt = self.will_terminate(new_obs)
-        return val, pos_candidates, wt
+        revised_obs[0] = self.get_mixed_obs(masks, real_idx, raw_obs)
+        return revised_obs.reshape((-1,))
+
+    # The search steps below are generators: every network query is yielded as a list of
+    # observations and the (values, possibilities) of the batch are sent back. run_steps()
+    # answers them with this tree's model, run_lockstep() answers the queries of many searches at once.
+
+    def evaluate_children(self, children, masks, cur_env):
+        # evaluate the states of the children in one forward pass
+        revised_obs = []
+        for child in children:
+            cur_env.box_creator.box_list = [self.box_list[child.number], self.env.bin_size]
+            revised_obs.append(self.get_revised_obs(cur_env.cur_observation, masks, child.number))
+        vals, poss = yield revised_obs
+        for child, obs, val, p in zip(children, revised_obs, vals, poss):
+            pos_candidates = list(np.argsort(p)[-self.pos_num:])
+            wt = self.will_terminate(obs[:self.mask_len])
+            child.evaluation = (float(val), pos_candidates, wt)
 
     def search(self, masks, cur_env, res_idxs, cur_node, cur_value, action):
         assert cur_node is not None
@@ -145,6 +173,10 @@ class ReorderTree(object):
                 if idx == self.box_num - 1 and len(res_idxs) > 1:
                     continue
                 cur_node.children.append(Node(parent=cur_node, number=idx, height=cur_node.height - 1))
+        # the state of a node only depends on its path, so the evaluations are kept for later simulations
+        pending = [node for node in cur_node.children if node.evaluation is None]
+        if len(pending) > 0:
+            yield from self.evaluate_children(pending, masks, cur_env)
 
         # find next node with max evaluation
         for node in cur_node.children:
@@ -159,15 +191,14 @@ class ReorderTree(object):
         if next_node is None:
             cur_node.update(-10000, None)
             return
+        self.reached_depth = max(self.reached_depth, self.box_num - 1 - next_node.height)
         idx = next_node.number
         cur_box = self.box_list[idx]
         cur_env.box_creator.box_list = [cur_box, self.env.bin_size]
-        cur_obs = cur_env.cur_observation
 
-        # print(cur_obs[0:100].reshape(10,10))
         # print(idx, cur_box)
 
-        val, pos_candidates, will_terminate = self.evaluate(cur_obs, masks, idx)
+        val, pos_candidates, will_terminate = next_node.evaluation
         pos = pos_candidates[-1]
         assert len(pos_candidates) == 1
 
@@ -179,6 +210,7 @@ class ReorderTree(object):
         #     will_terminate = True
 
         next_obs, reward, done, _ = cur_env.step([pos])
+        next_node.reward = reward
 
         if done or will_terminate: 
             fail_flag = False
@@ -220,16 +252,17 @@ class ReorderTree(object):
         # recursion
         if action is None and idx == 0:
             action = pos
-        self.search(next_masks, cur_env, next_idxs, next_node, next_value, action)
+        yield from self.search(next_masks, cur_env, next_idxs, next_node, next_value, action)
 
     def get_baseline(self):
-        env = copy.deepcopy(self.env)
+        env = self.env.clone()
         obs = env.cur_observation
         nor_exp = 0
         nor_act = None
         area = self.mask_len
         for i in range(self.box_num):
-            val, poss = self.nmodel.evaluate(obs)
+            vals, poss = yield [obs]
+            val, poss = float(vals[0]), poss[0]
             act = np.argmax(poss)
             if i == 0:
                 nor_act = act
@@ -242,21 +275,248 @@ class ReorderTree(object):
                 return nor_exp, nor_act
             nor_exp += reward
 
-    def reorder_search(self):
-        nor_exp, nor_act = self.get_baseline()
-        root = Node(None, None, self.box_num - 1)
-        root.max_value = nor_exp 
-        root.action = nor_act
-        for i in range(self.times):
-            sim_env = copy.deepcopy(self.env)
+    def simulate(self, root, times, deadline=None):
+        """
+        Run up to times simulations from root, stop early once perf_counter()
+        passes deadline. Return the number of simulations run.
+        """
+        # every simulation starts from the same state, restore it instead of copying the env
+        state = self.env.snapshot()
+        sims = 0
+        for i in range(times):
+            if deadline is not None and perf_counter() >= deadline:
+                break
+            self.env.restore(state)
             res_idxs = list(range(self.box_num))
             masks = np.ones((self.box_num, self.mask_len))
-            self.search(masks, sim_env, res_idxs, root, 0, None)
-        max_exp = root.max_value
-        max_act = root.action
+            yield from self.search(masks, self.env, res_idxs, root, 0, None)
+            sims += 1
+        self.env.restore(state)
+        return sims
+
+    def root_choices(self):
+        # the boxes that can be put first, the last one only when it is alone
+        if self.box_num == 1:
+            return [0]
+        return list(range(self.box_num - 1))
+
+    def search_subtrees(self, choices, times, nor_exp, nor_act, budget=None):
+        """
+        Run the simulations under the root children in choices only, for at
+        most budget seconds if given. Return the best value and action found,
+        the number of simulations and the depth reached.
+        """
+        deadline = perf_counter() + budget if budget is not None else None
+        root = Node(None, None, self.box_num - 1)
+        root.max_value = nor_exp
+        root.action = nor_act
+        root.children = [Node(parent=root, number=idx, height=root.height - 1) for idx in choices]
+        sims = self.run_steps(self.simulate(root, times, deadline))
+        return root.max_value, root.action, sims, self.reached_depth
+
+    def parallel_search(self, nor_exp, nor_act, deadline=None):
+        """
+        Root-parallel search: the first-level box choices are dealt round-robin
+        to the workers of the pool, each worker searches its subtrees with its
+        share of the simulations and the best (value, action) is merged in
+        worker order. The search itself has no randomness, so the result only
+        depends on the number of workers (and on the deadline, if any).
+        Return the best value and action, the number of simulations and
+        the depth reached.
+        """
+        choices = self.root_choices()
+        workers = min(self.pool.workers, len(choices))
+        budget = max(deadline - perf_counter(), 0) if deadline is not None else None
+        tasks = []
+        for w in range(workers):
+            part = choices[w::workers]
+            if deadline is None:
+                times = int(math.ceil(self.times * len(part) / len(choices)))
+            else:
+                # run until the deadline, or until every order under the subtrees is explored
+                times = len(part) * math.factorial(max(self.box_num - 2, 0))
+            tasks.append((self.box_list, self.env, part, times, self.p_bound, self.v_bound, nor_exp, nor_act, budget))
+        max_exp, max_act = nor_exp, nor_act
+        sims, depth = 0, 0
+        for value, action, worker_sims, worker_depth in self.pool.map(tasks):
+            if value > max_exp:
+                max_exp, max_act = value, action
+            sims += worker_sims
+            depth = max(depth, worker_depth)
+        return max_exp, max_act, sims, depth
+
+    def run_steps(self, steps):
+        # drive a search generator, answering its queries with this tree's model
+        try:
+            observations = next(steps)
+            while True:
+                vals, poss, _ = self.nmodel.evaluate_batch(observations)
+                observations = steps.send((vals, poss))
+        except StopIteration as stop:
+            return stop.value
+
+    def search_steps(self, times, deadline=None):
+        start = perf_counter()
+        self.reached_depth = 0
+        nor_exp, nor_act = yield from self.get_baseline()
+        if self.pool is not None:
+            max_exp, max_act, sims, depth = self.parallel_search(nor_exp, nor_act, deadline)
+        else:
+            if self.root is None:
+                self.root = Node(None, None, self.box_num - 1)
+            root = self.root
+            root.max_value = nor_exp
+            root.action = nor_act
+            sims = yield from self.simulate(root, times, deadline)
+            depth = self.reached_depth
+            max_exp = root.max_value
+            max_act = root.action
         if max_act != nor_act and max_exp - nor_exp < self.v_bound:
             # print('conservative!')
             max_exp = nor_exp
             max_act = nor_act
         default = (max_act == nor_act)
+        elapsed = perf_counter() - start
+        self.telemetry = {'simulations': sims, 'reached_depth': depth, 'time': elapsed,
+                          'time_per_simulation': elapsed / sims if sims > 0 else None,
+                          'deadline_hit': deadline is not None and perf_counter() >= deadline}
         return max_act, max_exp, default
+
+    def reorder_search(self):
+        return self.run_steps(self.search_steps(self.times))
+
+    def anytime_search(self, deadline_ms):
+        """
+        Search until deadline_ms milliseconds have passed or every box order
+        has been explored. The baseline action is computed first, so a
+        decision is returned even when the deadline leaves no time for any
+        simulation. Return the action, its value, whether it is the
+        baseline action and the search telemetry.
+        """
+        return self.run_steps(self.anytime_steps(deadline_ms))
+
+    def anytime_steps(self, deadline_ms):
+        deadline = perf_counter() + deadline_ms / 1000
+        times = math.factorial(self.box_num - 1)
+        max_act, max_exp, default = yield from self.search_steps(times, deadline)
+        return max_act, max_exp, default, self.telemetry
+
+    def succeed(self, put_action, box_list, env):
+        """
+        Move to the next placement: the subtree where the first box was put
+        at put_action becomes the new root, so the network evaluations of the
+        surviving box orders carry over. Return True if the subtree
+        could be reused, otherwise the next search starts from a new root.
+        """
+        put_action = int(put_action)
+        new_root = None
+        if self.root is not None and len(box_list) == self.box_num \
+                and [tuple(b) for b in box_list[:-1]] == [tuple(b) for b in self.box_list[1:]]:
+            for child in self.root.children:
+                if child.number == 0 and child.reward is not None and child.evaluation[1][-1] == put_action:
+                    new_root = child
+        self.env = env.clone()
+        self.box_list = copy.deepcopy(box_list)
+        self.box_num = len(box_list)
+        self.times = min(self.max_times, math.factorial(self.box_num - 1))
+        if new_root is None:
+            self.root = None
+            return False
+        new_root.parent = None
+        new_root.number = None
+        new_root.evaluation = None
+        new_root.reward = None
+        self.rebase(new_root, set())
+        self.root = new_root
+        return True
+
+    def rebase(self, node, placed):
+        # shift a reused subtree one level up: box indices drop by one and the tree gets one level deeper.
+        # The visits and values were counted over the orders of the old, shallower tree: kept, the old
+        # leaves look exhausted (visit >= max_v) and their values, which stop one box short, steer the
+        # search away from the new level. They restart, the network evaluations and the orders already
+        # found infeasible carry over
+        node.height += 1
+        node.max_v = math.factorial(node.height)
+        node.visit = 0
+        node.max_value = None
+        node.action = None
+        for child in node.children:
+            child.number -= 1
+            self.rebase(child, placed | {child.number})
+        # the last box of the old preview could not be chosen before, it can now
+        last = self.box_num - 2
+        if len(node.children) > 0 and last not in placed and all(c.number != last for c in node.children):
+            node.children.append(Node(parent=node, number=last, height=node.height - 1))
+        if node.disabled and len(node.children) == 0:
+            return
+        disabled_num = sum(c.disabled for c in node.children)
+        node.dis_num = node.height - disabled_num
+        node.disabled = disabled_num > 0 and node.dis_num == 0
+        if node.disabled:
+            node.dis_num = 0
+
+
+def run_lockstep(nmodel, steps):
+    """
+    Drive several search generators side by side. In every round the
+    pending queries of all of them are answered by one forward pass of
+    nmodel. Return the results of the generators in order.
+    """
+    results = [None] * len(steps)
+    pending = {}
+
+    def advance(i, answer):
+        try:
+            pending[i] = next(steps[i]) if answer is None else steps[i].send(answer)
+        except StopIteration as stop:
+            pending.pop(i, None)
+            results[i] = stop.value
+
+    for i in range(len(steps)):
+        advance(i, None)
+    while len(pending) > 0:
+        order = list(pending.keys())
+        observations = [obs for i in order for obs in pending[i]]
+        vals, poss, _ = nmodel.evaluate_batch(observations)
+        start = 0
+        for i in order:
+            end = start + len(pending[i])
+            advance(i, (vals[start:end], poss[start:end]))
+            start = end
+    return results
+
+
+_worker_model = None
+
+
+def _init_search_worker(nmodel):
+    global _worker_model
+    _worker_model = nmodel
+    # the workers already run in parallel, keep torch from oversubscribing the cores
+    torch.set_num_threads(1)
+
+
+def _search_subtrees(task):
+    box_list, env, choices, times, p_bound, v_bound, nor_exp, nor_act, budget = task
+    tree = ReorderTree(_worker_model, box_list, env, p_bound=p_bound, v_bound=v_bound, times=times)
+    return tree.search_subtrees(choices, times, nor_exp, nor_act, budget)
+
+
+class SearchPool(object):
+    """
+    Process pool for the root-parallel reorder search. The network is handed
+    to every worker once when the pool starts.
+    """
+    def __init__(self, nmodel, workers):
+        assert workers >= 1
+        self.workers = workers
+        self._pool = multiprocessing.Pool(workers, initializer=_init_search_worker, initargs=(nmodel,))
+
+    def map(self, tasks):
+        # results come back in task order, which keeps the merge deterministic
+        return self._pool.map(_search_subtrees, tasks)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
@@ -1,8 +1,10 @@
 import glob
 import os
+import torch
 import torch.nn as nn
 import numpy as np
 from acktr.envs import VecNormalize
+from envs.bpp0.feasibility import check_footprint, get_action_mask, batch_action_masks
 
 
 def check_box(plain, x, y, lx, ly, z, container_size):
@@ -12,89 +14,47 @@ def check_box(plain, x, y, lx, ly, z, container_size):
         return -1
 
     rec = plain[lx:lx + x, ly:ly + y]
-    max_h = np.max(rec)
-    max_area = np.sum(rec == max_h)
-    area = x * y
-
-    assert max_h >= 0
-    if max_h + z > container_size[2]:
-        return -1
-
-    LU = int(rec[0, 0] == max_h)
-    LD = int(rec[x - 1, 0] == max_h)
-    RU = int(rec[0, y - 1] == max_h)
-    RD = int(rec[x - 1, y - 1] == max_h)
-
-    if max_area / area > 0.95:
-        return max_h
-    if LU + LD + RU + RD == 3 and max_area / area > 0.85:
-        return max_h
-    if LU + LD + RU + RD == 4 and max_area / area > 0.50:
-        return max_h
-
-    return -1
+    return check_footprint(rec, z, container_size[2], strict_corners=False)
+
+def split_observations(observations, container_size):
+    """
+    Height maps (n, width, length) and next box sizes (n, 3) of a batch of
+    observations, either full (height map + 3 box planes) or compact
+    (height map + 3 box dims)
+    """
+    area = container_size[0] * container_size[1]
+    box_info = np.asarray(observations).reshape((-1, np.shape(observations)[-1]))
+    plains = box_info[:, :area].reshape((-1, container_size[0], container_size[1]))
+    if box_info.shape[1] == area + 3:
+        box_sizes = box_info[:, area:]
+    else:
+        box_sizes = box_info[:, area::area]
+    return plains, box_sizes
 
 def get_possible_position(observation, container_size):
     if not isinstance(observation, np.ndarray):
         box_info = observation.cpu().numpy()
     else:
         box_info = observation
-    box_info = box_info.reshape((4,-1))
-    x = int(box_info[1][0])
-    y = int(box_info[2][0])
-    z = int(box_info[3][0])
-
-    plain = box_info[0].reshape((container_size[0],container_size[1]))
-
-    width = container_size[0]
-    length = container_size[1]
-
-    action_mask = np.zeros(shape=(width, length), dtype=np.int32)
-
-    for i in range(width - x + 1):
-        for j in range(length - y + 1):
-            if check_box(plain, x, y, i, j, z, container_size) >= 0:
-                action_mask[i, j] = 1
+    plains, box_sizes = split_observations(box_info, container_size)
 
-    if action_mask.sum() == 0:
-        action_mask[:, :] = 1
-    # print(">>>x,y,z = {},{},{}".format(x, y, z))
-    # print(">>>plain = {}".format(plain))
-    # print(">>>action_mask = {}".format(action_mask))
-
-    return action_mask.reshape((-1,)).tolist()
+    action_mask = get_action_mask(plains[0], box_sizes[0], container_size[2], strict_corners=False)
+    return action_mask.tolist()
 
 def get_rotation_mask(observation, container_size):
-    box_info = observation.cpu().numpy()
-    box_info = box_info.reshape((4,-1))
-    x = int(box_info[1][0])
-    y = int(box_info[2][0])
-    z = int(box_info[3][0])
-
-    plain = box_info[0].reshape((container_size[0],container_size[1]))
-
-    width = container_size[0]
-    length = container_size[1]
-
-    action_mask1 = np.zeros(shape=(width, length), dtype=np.int32)
-    action_mask2 = np.zeros(shape=(width, length), dtype=np.int32)
-
-    for i in range(width - x + 1):
-        for j in range(length - y + 1):
-            if check_box(plain, x, y, i, j, z, container_size) >= 0:
-                action_mask1[i, j] = 1
-
-    for i in range(width - y + 1):
-        for j in range(length - x + 1):
-            if check_box(plain, y, x, i, j, z, container_size) >= 0:
-                action_mask2[i, j] = 1
-
-    action_mask = np.hstack((action_mask1.reshape((-1,)), action_mask2.reshape((-1,))))
-
-    if action_mask.sum() == 0:
-        action_mask[:] = 1
-
-    return action_mask
+    plains, box_sizes = split_observations(observation.cpu().numpy(), container_size)
+    return get_action_mask(plains[0], box_sizes[0], container_size[2], rotation=True, strict_corners=False)
+
+def get_location_masks(observations, container_size, enable_rotation=False):
+    """
+    Batched version of get_possible_position / get_rotation_mask: map the
+    (num_processes, obs_len) observation tensor to a (num_processes, act_len)
+    mask tensor on the same device
+    """
+    plains, box_sizes = split_observations(observations.cpu().numpy(), container_size)
+    masks = batch_action_masks(plains, box_sizes, container_size[2],
+                               rotation=enable_rotation, strict_corners=False)
+    return torch.from_numpy(masks).float().to(observations.device)
 
 def get_vec_normalize(venv):
     if isinstance(venv, VecNormalize):
@@ -9,11 +9,12 @@ class DummyVecEnv(VecEnv):
     Useful when debugging and when num_env == 1 (in the latter case,
     avoids communication overhead)
     """
-    def __init__(self, env_fns):
+    def __init__(self, env_fns, mask_len=None):
         """
         Arguments:
 
         env_fns: iterable of callables      functions that build environments
+        mask_len: int                       if given, keep the action mask (env.cur_mask) of every env
         """
         self.envs = [fn() for fn in env_fns]
         env = self.envs[0]
@@ -25,6 +26,7 @@ class DummyVecEnv(VecEnv):
         self.buf_dones = np.zeros((self.num_envs,), dtype=np.bool)
         self.buf_rews  = np.zeros((self.num_envs,), dtype=np.float32)
         self.buf_infos = [{} for _ in range(self.num_envs)]
+        self.buf_masks = np.zeros((self.num_envs, mask_len), dtype=np.float32) if mask_len else None
         self.actions = None
         self.spec = self.envs[0].spec
 
@@ -62,6 +64,8 @@ class DummyVecEnv(VecEnv):
         return self._obs_from_buf()
 
     def _save_obs(self, e, obs):
+        if self.buf_masks is not None:
+            self.buf_masks[e] = self.envs[e].cur_mask
         for k in self.keys:
             if k is None:
                 self.buf_obs[k][e] = obs
@@ -71,6 +75,10 @@ class DummyVecEnv(VecEnv):
     def _obs_from_buf(self):
         return dict_to_obs(copy_obs_dict(self.buf_obs))
 
+    def get_masks(self):
+        assert self.buf_masks is not None, 'DummyVecEnv was created without mask_len'
+        return np.copy(self.buf_masks)
+
     def get_images(self):
         return [env.render(mode='rgb_array') for env in self.envs]
 
@@ -22,10 +22,13 @@ class ShmemVecEnv(VecEnv):
     Optimized version of SubprocVecEnv that uses shared variables to communicate observations.
     """
 
-    def __init__(self, env_fns, spaces=None, context='spawn'):
+    def __init__(self, env_fns, spaces=None, context='spawn', mask_len=None):
         """
         If you don't specify observation_space, we'll have to create a dummy
         environment to get it.
+
+        If mask_len is given, every worker also writes the action mask of its
+        env (env.cur_mask) into a shared buffer after each reset and step.
         """
         ctx = mp.get_context(context)
         if spaces:
@@ -42,14 +45,15 @@ class ShmemVecEnv(VecEnv):
         self.obs_bufs = [
             {k: ctx.Array(_NP_TO_CT[self.obs_dtypes[k].type], int(np.prod(self.obs_shapes[k]))) for k in self.obs_keys}
             for _ in env_fns]
+        self.mask_bufs = [ctx.Array(ctypes.c_float, mask_len) if mask_len else None for _ in env_fns]
         self.parent_pipes = []
         self.procs = []
         with clear_mpi_env_vars():
-            for env_fn, obs_buf in zip(env_fns, self.obs_bufs):
+            for env_fn, obs_buf, mask_buf in zip(env_fns, self.obs_bufs, self.mask_bufs):
                 wrapped_fn = CloudpickleWrapper(env_fn)
                 parent_pipe, child_pipe = ctx.Pipe()
                 proc = ctx.Process(target=_subproc_worker,
-                            args=(child_pipe, parent_pipe, wrapped_fn, obs_buf, self.obs_shapes, self.obs_dtypes, self.obs_keys))
+                            args=(child_pipe, parent_pipe, wrapped_fn, obs_buf, self.obs_shapes, self.obs_dtypes, self.obs_keys, mask_buf))
                 proc.daemon = True
                 self.procs.append(proc)
                 self.parent_pipes.append(parent_pipe)
@@ -89,6 +93,14 @@ class ShmemVecEnv(VecEnv):
         for proc in self.procs:
             proc.join()
 
+    def get_masks(self):
+        """
+        Action masks written by the workers for the current observations,
+        shape (num_envs, mask_len). Read straight from shared memory.
+        """
+        assert self.mask_bufs[0] is not None, 'ShmemVecEnv was created without mask_len'
+        return np.stack([np.frombuffer(b.get_obj(), dtype=np.float32) for b in self.mask_bufs])
+
     def get_images(self, mode='human'):
         for pipe in self.parent_pipes:
             pipe.send(('render', None))
@@ -104,7 +116,7 @@ class ShmemVecEnv(VecEnv):
         return dict_to_obs(result)
 
 
-def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs_dtypes, keys):
+def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs_dtypes, keys, mask_buf=None):
     """
     Control a single environment instance using IPC and
     shared memory.
@@ -116,17 +128,24 @@ def _subproc_worker(pipe, parent_pipe, env_fn_wrapper, obs_bufs, obs_shapes, obs
             dst_np = np.frombuffer(dst, dtype=obs_dtypes[k]).reshape(obs_shapes[k])  # pylint: disable=W0212
             np.copyto(dst_np, flatdict[k])
 
+    def _write_mask():
+        if mask_buf is not None:
+            np.copyto(np.frombuffer(mask_buf.get_obj(), dtype=np.float32), env.cur_mask)
+
     env = env_fn_wrapper.x()
     parent_pipe.close()
     try:
         while True:
             cmd, data = pipe.recv()
             if cmd == 'reset':
-                pipe.send(_write_obs(env.reset()))
+                obs = env.reset()
+                _write_mask()
+                pipe.send(_write_obs(obs))
             elif cmd == 'step':
                 obs, reward, done, info = env.step(data)
                 if done:
                     obs = env.reset()
+                _write_mask()
                 pipe.send((_write_obs(obs), reward, done, info))
             elif cmd == 'render':
                 pipe.send(env.render(mode='rgb_array'))
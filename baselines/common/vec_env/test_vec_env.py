@@ -111,6 +111,36 @@ def test_sync_sampling_sanity(dtype, num_envs_in_series):
     assert_venvs_equal(env1, env2, num_steps=num_steps)
 
 
+def test_shmem_masks():
+    """
+    Test that the action masks ShmemVecEnv workers write to
+    shared memory match the ones kept by DummyVecEnv.
+    """
+    num_envs = 3
+    num_steps = 20
+    shape = (3, 8)
+
+    def make_fn(seed):
+        return lambda: MaskedEnv(seed, shape, 'float32')
+    fns = [make_fn(i) for i in range(num_envs)]
+    env1 = DummyVecEnv(fns, mask_len=MaskedEnv.mask_len)
+    env2 = ShmemVecEnv(fns, mask_len=MaskedEnv.mask_len)
+    try:
+        env1.reset()
+        env2.reset()
+        assert env2.get_masks().shape == (num_envs, MaskedEnv.mask_len)
+        assert np.array_equal(env1.get_masks(), env2.get_masks())
+        env1.action_space.seed(1337)
+        for _ in range(num_steps):
+            actions = np.array([env1.action_space.sample() for _ in range(num_envs)])
+            env1.step(actions)
+            env2.step(actions)
+            assert np.array_equal(env1.get_masks(), env2.get_masks())
+    finally:
+        env1.close()
+        env2.close()
+
+
 class SimpleEnv(gym.Env):
     """
     An environment with a pre-determined observation space
@@ -147,6 +177,17 @@ class SimpleEnv(gym.Env):
 
 
 
+class MaskedEnv(SimpleEnv):
+    """
+    A SimpleEnv that exposes an action mask derived from its observation.
+    """
+    mask_len = 8
+
+    @property
+    def cur_mask(self):
+        return (self._cur_obs[0] > 0x80).astype(np.float32)
+
+
 @with_mpi()
 def test_mpi_with_subprocvecenv():
     shape = (2,3,4)
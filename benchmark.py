@@ -0,0 +1,382 @@
+# We'll use this script to measure the latency of the performance critical parts
+import argparse
+import copy
+from timeit import default_timer as timer
+import numpy as np
+from envs.bpp0.space import Space
+from envs.bpp0.feasibility import position_mask
+
+
+def random_plain(rng, size, levels=4):
+    heights = rng.integers(0, size[2] // 2, size=levels)
+    return rng.choice(heights, size=size[:2]).astype(np.int32)
+
+
+def time_call(fn, repeat):
+    start = timer()
+    for _ in range(repeat):
+        fn()
+    return (timer() - start) / repeat
+
+
+def bench_masks(args):
+    """
+        Per-call latency of the feasibility mask: the scalar check_box loop vs. the vectorized engine
+    """
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %-12s %14s %14s %10s' % ('container', 'box', 'loop (ms)', 'vector (ms)', 'speedup'))
+    for size in args.sizes:
+        container = (size, size, size)
+        space = Space(*container)
+        space.plain[:, :, 0] = random_plain(rng, container)
+        x, y, z = max(1, size // 5), max(1, size // 4), max(1, size // 5)
+
+        def loop():
+            mask = np.zeros(shape=(size, size), dtype=np.int32)
+            for i in range(size - x + 1):
+                for j in range(size - y + 1):
+                    if space.check_box(space.plain, x, y, i, j, z) >= 0:
+                        mask[i, j] = 1
+            return mask
+
+        def vector():
+            # the engine itself, without the optional mask cache of Space
+            return position_mask(space.plain[:, :, 0], x, y, z, space.height)
+
+        assert (loop() == vector()).all()
+        t_loop = time_call(loop, args.repeat)
+        t_vec = time_call(vector, args.repeat)
+        print('%-10s %-12s %14.3f %14.3f %9.1fx' % ('%dx%d' % (size, size), (x, y, z),
+                                                     t_loop * 1e3, t_vec * 1e3, t_loop / t_vec))
+
+
+def bench_batch_masks(args):
+    """
+        Location masks for a whole vector-env batch: one get_possible_position call per row vs. one batched call
+    """
+    import torch
+    from acktr.utils import get_possible_position, get_location_masks
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %-10s %14s %14s %10s' % ('container', 'processes', 'per-row (ms)', 'batched (ms)', 'speedup'))
+    for size in args.sizes:
+        container = (size, size, size)
+        for num_processes in args.num_processes:
+            rows = []
+            for _ in range(num_processes):
+                box = rng.integers(max(1, size // 5), max(2, size // 2), size=3)
+                rows.append(np.concatenate([random_plain(rng, container).reshape(-1),
+                                            np.repeat(box, size * size)]))
+            obs = torch.tensor(np.array(rows), dtype=torch.float32)
+
+            def per_row():
+                return torch.FloatTensor([get_possible_position(o, container) for o in obs])
+
+            def batched():
+                return get_location_masks(obs, container)
+
+            assert torch.equal(per_row(), batched())
+            t_row = time_call(per_row, args.repeat)
+            t_batch = time_call(batched, args.repeat)
+            print('%-10s %-10d %14.3f %14.3f %9.1fx' % ('%dx%d' % (size, size), num_processes,
+                                                         t_row * 1e3, t_batch * 1e3, t_row / t_batch))
+
+
+def bench_space(args):
+    """
+        Cost of putting a box into the height map: deepcopy-and-update vs. in-place update, and snapshot/restore
+    """
+    from envs.bpp0.space import Box
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %14s %14s %16s' % ('container', 'deepcopy (us)', 'in-place (us)', 'snap+rest (us)'))
+    for size in args.sizes:
+        space = Space(size, size, size)
+        space.plain[:, :, 0] = random_plain(rng, (size, size, size))
+        x, y = max(1, size // 5), max(1, size // 4)
+        box = Box(x, y, 1, size // 3, size // 3, 0, 0)
+
+        def copy_update():
+            space.update_height_graph(copy.deepcopy(space.plain), box, inplace=True)
+
+        def inplace_update():
+            space.update_height_graph(space.plain, box, inplace=True)
+
+        def snapshot_restore():
+            space.restore(space.snapshot())
+
+        t_copy = time_call(copy_update, args.repeat * 50)
+        t_inplace = time_call(inplace_update, args.repeat * 50)
+        t_snap = time_call(snapshot_restore, args.repeat * 50)
+        print('%-10s %14.2f %14.2f %16.2f' % ('%dx%d' % (size, size), t_copy * 1e6, t_inplace * 1e6, t_snap * 1e6))
+
+
+def bench_env_copy(args):
+    """
+        Cost of copying a half-filled env for search: copy.deepcopy vs. clone() vs. snapshot()/restore()
+    """
+    from envs.bpp0 import PackingGame
+    np.random.seed(args.seed)
+    print('%-10s %14s %14s %16s' % ('container', 'deepcopy (us)', 'clone (us)', 'snap+rest (us)'))
+    for size in args.sizes:
+        env = PackingGame(container_size=(size, size, size), box_set=[(2, 2, 2)], data_type='rs')
+        env.reset()
+        for _ in range(size):
+            env.step([np.random.choice(np.flatnonzero(env.get_possible_position()))])
+        t_deepcopy = time_call(lambda: copy.deepcopy(env), args.repeat * 10)
+        t_clone = time_call(env.clone, args.repeat * 10)
+        t_snap = time_call(lambda: env.restore(env.snapshot()), args.repeat * 10)
+        print('%-10s %14.2f %14.2f %16.2f' % ('%dx%d' % (size, size), t_deepcopy * 1e6, t_clone * 1e6, t_snap * 1e6))
+
+
+def bench_evaluate(args):
+    """
+        Network evaluation of a batch of states: one nnModel.evaluate call per state vs. one evaluate_batch call
+    """
+    import sys
+    from acktr.arguments import get_args
+    from acktr.model_loader import nnModel
+    sys.argv = sys.argv[:1]
+    model_args = get_args()
+    nmodel = nnModel(args.model, model_args)
+    container = model_args.container_size
+    area = container[0] * container[1]
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %14s %14s %14s' % ('states', 'single (ms)', 'batched (ms)', 'states/ms'))
+    for num in args.num_processes:
+        rows = []
+        for _ in range(num):
+            box = rng.integers(1, container[2] // 2 + 1, size=3)
+            rows.append(np.concatenate([random_plain(rng, container).reshape(-1), np.repeat(box, area)]))
+        rows = np.array(rows, dtype=np.float64)
+
+        def single():
+            return [nmodel.evaluate(o) for o in rows]
+
+        def batched():
+            return nmodel.evaluate_batch(rows)
+
+        t_single = time_call(single, args.repeat)
+        t_batch = time_call(batched, args.repeat)
+        print('%-10d %14.3f %14.3f %14.1f' % (num, t_single * 1e3, t_batch * 1e3, num / (t_batch * 1e3)))
+
+
+def bench_cut1(args):
+    """
+        CUT-1 sequence generation: CuttingBoxCreator vs. FastCuttingBoxCreator, in sequences per second.
+        Box ranges either scale with the container or stay at the default 2-5, where the box count grows cubically
+    """
+    import random
+    from envs.bpp0.cutCreator import CuttingBoxCreator, FastCuttingBoxCreator
+    print('%-10s %-10s %12s %14s %14s %10s' % ('container', 'box range', 'boxes/seq', 'current (/s)', 'fast (/s)', 'speedup'))
+    for size in args.sizes:
+        container = (size, size, size)
+        for low, high in dict.fromkeys(((max(2, size // 5), max(2, size // 2)), (2, 5))):
+            box_range = [low] * 3 + [high] * 3
+            current = CuttingBoxCreator(container, box_range, rotation=True)
+            fast = FastCuttingBoxCreator(container, box_range, rotation=True)
+            # the current creator is quadratic in the box count, keep the large cases short
+            count = max(1, args.repeat * low * low // max(1, size // 10) ** 2 // 4)
+
+            def sample(creator):
+                random.seed(args.seed)
+                np.random.seed(args.seed)
+                return [creator.sample_sequence() for _ in range(count)]
+
+            t_current = timer()
+            seqs = sample(current)
+            t_current = timer() - t_current
+            assert seqs == sample(fast)
+            t_fast = time_call(lambda: sample(fast), 1)
+            boxes = sum(len(seq) for seq in seqs) / len(seqs)
+            print('%-10s %-10s %12.1f %14.2f %14.2f %9.1fx' % ('%dx%d' % (size, size), '%d-%d' % (low, high), boxes,
+                                                               count / t_current, count / t_fast, t_current / t_fast))
+
+
+def chi2_same(a, b):
+    """
+        Two-sample chi-square test that the samples a and b come from the same categorical distribution,
+        return the p-value
+    """
+    import torch
+    keys = sorted(set(a) | set(b))
+    count_a = np.array([a.count(k) for k in keys], dtype=np.float64)
+    count_b = np.array([b.count(k) for k in keys], dtype=np.float64)
+    total = count_a + count_b
+    exp_a = total * count_a.sum() / total.sum()
+    exp_b = total * count_b.sum() / total.sum()
+    stat = ((count_a - exp_a) ** 2 / exp_a).sum() + ((count_b - exp_b) ** 2 / exp_b).sum()
+    dof = max(len(keys) - 1, 1)
+    return torch.special.gammaincc(torch.tensor(dof / 2, dtype=torch.float64),
+                                   torch.tensor(stat / 2, dtype=torch.float64)).item()
+
+
+def bench_cut2(args):
+    """
+        CUT-2 sequence generation: MDlayerBoxCreator vs. FastMDlayerBoxCreator, in sequences per second, then a
+        chi-square test of the generated sizes on 10x10x10 with edges 2-5. Boxes of one sequence are dependent,
+        so every test takes one sample per sequence: a random box, the first box and the box count
+    """
+    import random
+    from envs.bpp0.mdCreator import MDlayerBoxCreator, FastMDlayerBoxCreator
+    print('%-10s %-10s %12s %14s %14s %10s' % ('container', 'box range', 'boxes/seq', 'current (/s)', 'fast (/s)', 'speedup'))
+    for size in args.sizes:
+        container = (size, size, size)
+        for bound in dict.fromkeys(((max(2, size // 5), max(2, size // 2)), (2, 5))):
+            current = MDlayerBoxCreator(container, list(bound))
+            fast = FastMDlayerBoxCreator(container, list(bound))
+            count = max(1, args.repeat * bound[0] * bound[0] // max(1, size // 10) ** 2 // 4)
+            random.seed(args.seed)
+            t_current = timer()
+            seqs = [current.sample_sequence() for _ in range(count)]
+            t_current = timer() - t_current
+            t_fast = time_call(lambda: [fast.sample_sequence() for _ in range(count)], 1)
+            boxes = sum(len(seq) for seq in seqs) / len(seqs)
+            print('%-10s %-10s %12.1f %14.2f %14.2f %9.1fx' % ('%dx%d' % (size, size), '%d-%d' % bound, boxes,
+                                                               count / t_current, count / t_fast, t_current / t_fast))
+
+    samples = args.repeat * 100
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    features = {
+        'box': lambda seq: tuple(rng.choice(seq[:-1])[:3]),
+        'box x': lambda seq: rng.choice(seq[:-1])[0],
+        'box z': lambda seq: rng.choice(seq[:-1])[2],
+        'first box': lambda seq: tuple(seq[0][:3]),
+        'box count': lambda seq: len(seq),
+    }
+    seqs = []
+    for creator in (MDlayerBoxCreator((10, 10, 10), [2, 5]), FastMDlayerBoxCreator((10, 10, 10), [2, 5])):
+        seqs.append([creator.sample_sequence() for _ in range(samples)])
+    print('%-10s %10s   (%d sequences each)' % ('feature', 'p-value', samples))
+    for name, feature in features.items():
+        print('%-10s %10.3f' % (name, chi2_same([feature(seq) for seq in seqs[0]], [feature(seq) for seq in seqs[1]])))
+
+
+def bench_vec_env(args):
+    """
+        Training env throughput in bin steps per second: one PackingGame process per bin (ShmemVecEnv) vs.
+        BatchedPackingGame stepping every bin as arrays in one process. Actions are drawn from the action masks
+    """
+    from envs.bpp0 import PackingGame
+    from envs.bpp0.batched import BatchedPackingGame
+    from envs.bpp0.mdCreator import FastMDlayerBoxCreator
+    from baselines.common.vec_env.shmem_vec_env import ShmemVecEnv
+    rng = np.random.default_rng(args.seed)
+    steps = args.repeat * 5
+
+    def run(envs):
+        envs.reset()
+        start = timer()
+        for _ in range(steps):
+            masks = envs.get_masks()
+            # one random feasible action per bin
+            scores = rng.random(masks.shape) * masks
+            envs.step(scores.argmax(axis=1))
+        return envs.num_envs * steps / (timer() - start)
+
+    print('%-10s %-22s %16s' % ('container', 'env', 'bin steps/s'))
+    for size in args.sizes:
+        container = (size, size, size)
+        bound = [max(2, size // 5), max(2, size // 2)]
+        box_set = [(bound[0],) * 3, (bound[1],) * 3]
+        for num in args.num_processes:
+            envs = ShmemVecEnv([lambda: PackingGame(container_size=container, box_set=box_set, data_type='cut2')] * num,
+                               context='fork', mask_len=size * size)
+            print('%-10s %-22s %16.1f' % ('%dx%d' % (size, size), 'shmem, %d processes' % num, run(envs)))
+            envs.close()
+        for num in sorted(set(args.num_processes) | {256}):
+            envs = BatchedPackingGame(num, container, FastMDlayerBoxCreator(container, bound))
+            print('%-10s %-22s %16.1f' % ('%dx%d' % (size, size), 'batched, %d bins' % num, run(envs)))
+
+
+def bench_incremental_masks(args):
+    """
+        Mask of the next box along packing episodes with a small fixed box set: full position_mask every step vs.
+        MaskCache, which rechecks only the positions whose footprint overlaps the last placed box
+    """
+    from envs.bpp0.feasibility import MaskCache
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %-8s %14s %16s %10s' % ('container', 'steps', 'full (us)', 'cached (us)', 'speedup'))
+    for size in args.sizes:
+        # five box types, like the SKU sets of RandomBoxCreator and boxgen_candidates
+        box_set = [tuple(rng.integers(max(1, size // 10), max(2, size // 5) + 1, size=3)) for _ in range(5)]
+        t_full, t_cached, steps = 0.0, 0.0, 0
+        for _ in range(args.repeat):
+            space = Space(size, size, size)
+            cache = MaskCache(size)
+            while True:
+                x, y, z = box_set[rng.integers(len(box_set))]
+                hmap = space.plain[:, :, 0]
+                start = timer()
+                full = position_mask(hmap, x, y, z, size)
+                t_full += timer() - start
+                start = timer()
+                cached = cache.position_mask(hmap, x, y, z)
+                t_cached += timer() - start
+                assert (full == cached).all()
+                if full.sum() == 0:
+                    break
+                idx = rng.choice(np.flatnonzero(full))
+                space.drop_box((x, y, z, 0), idx, False)
+                lx, ly = space.idx_to_position(idx)
+                start = timer()
+                cache.update(space.plain[:, :, 0], lx, ly, x, y)
+                t_cached += timer() - start
+                steps += 1
+        print('%-10s %-8d %14.1f %16.1f %9.1fx' % ('%dx%d' % (size, size), steps, t_full / steps * 1e6,
+                                                   t_cached / steps * 1e6, t_full / t_cached))
+
+
+def bench_multi_bin(args):
+    """
+        Masks of all the container-sized windows of a large plain in multi_bin.get_action: batch_action_masks over the
+        window crops vs. window_masks, one position_mask over the whole plain
+    """
+    from envs.bpp0.feasibility import batch_action_masks
+    from multi_bin.multi_bin import slipingWindow, window_masks
+    container = (10, 10, 10)
+    rng = np.random.default_rng(args.seed)
+    print('%-10s %-8s %-8s %14s %16s %10s' % ('plain', 'stride', 'windows', 'windows (ms)', 'whole plain (ms)',
+                                              'speedup'))
+    for size in args.sizes:
+        plain = random_plain(rng, (size, size, container[2]))
+        box = tuple(int(v) for v in rng.integers(2, 6, size=3))
+        for stride in (10, 5, 2):
+            def per_window():
+                plains = np.array([p for p, _, _ in slipingWindow(plain, container, stride)])
+                return batch_action_masks(plains, np.tile(box, (len(plains), 1)), container[2], strict_corners=False)
+
+            def whole_plain():
+                return window_masks(plain, box, container, stride)
+
+            masks = per_window()
+            assert (masks == whole_plain()).all()
+            t_window = time_call(per_window, args.repeat)
+            t_whole = time_call(whole_plain, args.repeat)
+            print('%-10s %-8d %-8d %14.3f %16.3f %9.1fx' % ('%dx%d' % (size, size), stride, len(masks),
+                                                            t_window * 1e3, t_whole * 1e3, t_window / t_whole))
+
+
+BENCHMARKS = {
+    'masks': bench_masks,
+    'batch_masks': bench_batch_masks,
+    'space': bench_space,
+    'env_copy': bench_env_copy,
+    'evaluate': bench_evaluate,
+    'cut1': bench_cut1,
+    'cut2': bench_cut2,
+    'vec_env': bench_vec_env,
+    'incremental_masks': bench_incremental_masks,
+    'multi_bin': bench_multi_bin,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', choices=sorted(BENCHMARKS.keys()), help='which part to benchmark')
+    parser.add_argument('--sizes', nargs='+', default=(10, 25, 50), type=int, help='container sizes to benchmark')
+    parser.add_argument('--num_processes', nargs='+', default=(16, 32), type=int, help='batch sizes to benchmark')
+    parser.add_argument('--repeat', default=20, type=int, help='calls per measurement')
+    parser.add_argument('--model', default='pretrained_models/default_cut_2.pt', help='model used by the evaluate target')
+    parser.add_argument('--seed', default=0, type=int, help='random seed')
+    args = parser.parse_args()
+    BENCHMARKS[args.target](args)
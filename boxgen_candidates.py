@@ -29,7 +29,8 @@ BOX_HH_SIZES = {
 
 
 def vanilla_boxgen(box_seq_len, box_real_sizes, cases, bin_real_size=1000, 
-                   grid_num=25, box_type_num_range=[0, 12], permute=False, save=False):
+                   grid_num=25, box_type_num_range=[0, 12], permute=False, save=False,
+                   box_type_weights=None):
     """
         Given a dict of actual box types and sizes:
         1. parameterizing the sizes into grid value
@@ -43,47 +44,41 @@ def vanilla_boxgen(box_seq_len, box_real_sizes, cases, bin_real_size=1000,
             grid_num: number of grid along length and width direction
             box_type_num_range: range of box types to use to generate box sequences
             permute [boolean]: if true, permute l, w, and h of each box
+            box_type_weights [dict]: relative frequency of each box type, {box_type: weight}, types left out
+                are never drawn. Uniform over the box grid sizes if None
+
+        Returns:
+            a (cases, box_seq_len, 4) int array of box grid sizes
     """
-    box_sets = []
     grid_size = np.ceil(bin_real_size / grid_num)
     print("grid size: {}".format(grid_size))
 
-    # extract the box sizes from the dict into a list
-    size_list = []
-    for k, v in box_real_sizes.items():
-        size_list.append(v)
-    size_list = np.array(size_list).flatten()
-
-    box_grid_sizes = {}
-    for k, v in box_real_sizes.items():
-        box_grid_sizes[k] = np.hstack((np.ceil((np.array(v)/grid_size)).astype(int),
-                                      100*(np.ceil((np.array(v)/grid_size)[-1]) - v[-1]/grid_size))).tolist()
-    print("box grid sizes:\n{}".format(box_grid_sizes))
-    
-    sel_box_grid_sizes = []
-    box_grid_sizes = dict(list(box_grid_sizes.items())[box_type_num_range[0]:box_type_num_range[-1]])
-    for k, v in box_grid_sizes.items():
-        if permute:
-            v = multiset_permutations(v)
-            for box_grid_size in v:
-                sel_box_grid_sizes.append(box_grid_size)
-        else:
-            sel_box_grid_sizes.append(v)
-    print("length of sel_box_grid_sizes:\n{}".format(len(sel_box_grid_sizes)))
-    print("sel_box_grid_sizes:\n{}".format(sel_box_grid_sizes))
-    box_grid_sizes = sel_box_grid_sizes
+    # parameterize all the sizes at once, the 4th value is the rounding gap of the height in percent of a grid
+    box_types = list(box_real_sizes.keys())[box_type_num_range[0]:box_type_num_range[-1]]
+    real_sizes = np.array([box_real_sizes[k] for k in box_types], dtype=np.float64)
+    grid_sizes = np.ceil(real_sizes / grid_size)
+    grid_sizes = np.hstack((grid_sizes, 100 * (grid_sizes[:, -1:] - real_sizes[:, -1:] / grid_size)))
+    print("box grid sizes:\n{}".format(dict(zip(box_types, grid_sizes.tolist()))))
 
-    for i in range(cases):
-        box_indices = np.random.randint(low=0, high=len(box_grid_sizes), size=box_seq_len)
-        box_set = [[int(box_grid_sizes[box_index][0]), 
-                    int(box_grid_sizes[box_index][1]), 
-                    int(box_grid_sizes[box_index][2]), 
-                    int(box_grid_sizes[box_index][3])] for box_index in box_indices]
-        box_sets.append(box_set)
-        if i % 100 == 0:
-            print("\n>>> Box set {}, length {}:\n{}".format(i, len(box_set), box_set))
+    # table of the box grid sizes to draw from, with the box type of every row
+    table = []
+    table_types = []
+    for k, v in zip(box_types, grid_sizes.tolist()):
+        rows = list(multiset_permutations(v)) if permute else [v]
+        table.extend(rows)
+        table_types.extend([k] * len(rows))
+    table = np.array(table).astype(int)
+    print("length of sel_box_grid_sizes:\n{}".format(len(table)))
+    print("sel_box_grid_sizes:\n{}".format(table.tolist()))
 
-    return box_sets
+    if box_type_weights is None:
+        box_indices = np.random.randint(low=0, high=len(table), size=(cases, box_seq_len))
+    else:
+        # a type's weight is shared by its permutations
+        weights = np.array([box_type_weights.get(k, 0) / table_types.count(k) for k in table_types], dtype=np.float64)
+        assert weights.sum() > 0, 'no box type with a positive weight'
+        box_indices = np.random.choice(len(table), size=(cases, box_seq_len), p=weights / weights.sum())
+    return table[box_indices]
 
 
 if __name__ == "__main__":
@@ -109,4 +104,4 @@ if __name__ == "__main__":
     # print("box_sequences:\n", box_sequences)
 
     if len(box_sequences) == cases:
-        torch.save(box_sequences, 'real_boxgen.pt')
\ No newline at end of file
+        torch.save(box_sequences.tolist(), 'real_boxgen.pt')
\ No newline at end of file
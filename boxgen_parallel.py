@@ -0,0 +1,119 @@
+# We'll use this script to generate large cut1/cut2 box sequence datasets in parallel
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import shutil
+from time import perf_counter
+import numpy as np
+from envs.bpp0.bin3D import make_box_creator
+from envs.bpp0.dataset import pack_sequences, volume_ratios, merge_datasets
+
+# the box creator of a worker process
+_creator = None
+
+
+def _init_worker(creator):
+    global _creator
+    _creator = creator
+
+
+def generate_chunk(job):
+    """
+    Generate one chunk of sequences with its own seed and write it to the
+    parts directory. The chunk is written to a temporary file and renamed,
+    so an interrupted run never leaves a partial chunk behind.
+    """
+    index, count, seed, container_size, path = job
+    random.seed(seed)
+    np.random.seed(seed)
+    # drop the sentinel box every sequence ends with, store boxes as [x, y, z, 0] like boxgen_range.py
+    sequences = [[box[:3] for box in _creator.sample_sequence()[:-1]] for _ in range(count)]
+    boxes, offsets = pack_sequences(sequences, width=4)
+    ratios = volume_ratios(boxes, offsets, container_size)
+    if not np.all(ratios == 1.0):
+        bad = np.flatnonzero(ratios != 1.0)[0]
+        raise ValueError('The space ratio of generated box is not 1.0 (chunk %d, sequence %d, ratio %f)'
+                         % (index, bad, ratios[bad]))
+    np.savez(path + '.tmp.npz', boxes=boxes, offsets=offsets)
+    os.replace(path + '.tmp.npz', path)
+    return index, count
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='generate a cut1/cut2 dataset in the columnar .npz format')
+    parser.add_argument('output', help='the .npz file to write')
+    parser.add_argument('--item_seq', default='cut2', help='item sequence generator, cut1|cut2')
+    parser.add_argument('--container_size', nargs='+', default=(10, 10, 10), type=int, help='container size along x, y and z axis')
+    parser.add_argument('--item_size_range', nargs='+', default=(2, 2, 2, 5, 5, 5), type=int,
+                        help='the item size range, (min_width, min_length, min_height, max_width, max_length, max_height)')
+    parser.add_argument('--enable_rotation', action='store_true', default=False, help='randomly rotate cut1 boxes')
+    parser.add_argument('--cases', default=10000, type=int, help='the number of sequences to generate')
+    parser.add_argument('--chunk', default=1000, type=int, help='sequences per chunk, the unit of work and of resuming')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int, help='generator processes')
+    parser.add_argument('--seed', default=1, type=int, help='chunk i is generated with seed + i')
+    parser.add_argument('--keep_chunks', action='store_true', default=False, help='keep the chunk files after merging')
+    args = parser.parse_args()
+    if args.item_seq not in ['cut1', 'cut2']:
+        raise Exception('Unsupported generator \'%s\'' % args.item_seq)
+    return args
+
+
+def chunk_dir(args):
+    """
+    The directory holding the finished chunks of output. A rerun with the
+    same settings resumes from it, other settings are refused.
+    """
+    parts = args.output + '.parts'
+    config = {'item_seq': args.item_seq, 'container_size': list(args.container_size),
+              'item_size_range': list(args.item_size_range), 'enable_rotation': args.enable_rotation,
+              'cases': args.cases, 'chunk': args.chunk, 'seed': args.seed}
+    config_path = os.path.join(parts, 'config.json')
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            if json.load(f) != config:
+                raise Exception('%s was started with other settings, remove it or choose another output' % parts)
+    else:
+        os.makedirs(parts, exist_ok=True)
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+    return parts
+
+
+if __name__ == '__main__':
+    args = get_args()
+    box_range = args.item_size_range
+    box_set = [(i, j, k) for i in range(box_range[0], box_range[3] + 1)
+               for j in range(box_range[1], box_range[4] + 1)
+               for k in range(box_range[2], box_range[5] + 1)]
+    creator = make_box_creator(args.item_seq, args.container_size, box_set, args.enable_rotation)
+
+    parts = chunk_dir(args)
+    chunks = []
+    for index, start in enumerate(range(0, args.cases, args.chunk)):
+        path = os.path.join(parts, 'chunk_%06d.npz' % index)
+        chunks.append((index, min(args.chunk, args.cases - start), args.seed + index, args.container_size, path))
+    pending = [job for job in chunks if not os.path.exists(job[-1])]
+
+    print("----- Box Generator Config -----")
+    print('Item size range (xl,yl,zl,xh,yh,zh): ', args.item_size_range)
+    print('Container size: ', args.container_size)
+    print('Generator type: ', args.item_seq)
+    print('Case number: ', args.cases)
+    print('Chunks: %d, done: %d, workers: %d' % (len(chunks), len(chunks) - len(pending), args.workers))
+
+    start = perf_counter()
+    done = sum(job[1] for job in chunks) - sum(job[1] for job in pending)
+    generated = 0
+    with multiprocessing.Pool(args.workers, initializer=_init_worker, initargs=(creator,)) as pool:
+        for index, count in pool.imap_unordered(generate_chunk, pending):
+            generated += count
+            elapsed = perf_counter() - start
+            print('chunk %d done, %d/%d sequences, %.1f sequences/s'
+                  % (index, done + generated, args.cases, generated / elapsed))
+
+    total = merge_datasets([job[-1] for job in chunks], args.output)
+    if not args.keep_chunks:
+        shutil.rmtree(parts)
+    print('wrote %d sequences (%d boxes) to %s' % (args.cases, total, args.output))
@@ -0,0 +1,137 @@
+import gym
+import numpy as np
+from baselines.common.vec_env import VecEnv
+from .feasibility import support_rule, batch_action_masks
+
+
+class BatchedPackingGame(VecEnv):
+    """
+    num_envs PackingGames stepped together in one process. The height maps
+    are one (num_envs, width, length) array and the box queues one padded
+    (num_envs, max_len, 3) array with a cursor per bin, so step, rewards and
+    masks are NumPy over the batch axis. Follows PackingGame.step (same
+    stability check, rewards and info) and resets finished bins like the
+    other VecEnvs. Each reset takes a whole sequence from
+    box_creator.sample_sequence(), whose last box is repeated once the
+    sequence runs out. The height compensation (h_comp) is not supported.
+    With compact_obs the observations hold the box dims instead of planes.
+    """
+    def __init__(self, num_envs, container_size, box_creator, enable_rotation=False, compact_obs=False):
+        self.bin_size = tuple(container_size)
+        self.box_creator = box_creator
+        self.can_rotate = enable_rotation
+        width, length, height = self.bin_size
+        self.area = width * length
+        self.act_len = self.area * (1 + self.can_rotate)
+        self.compact_obs = compact_obs
+        obs_len = self.area + 3 if compact_obs else self.area * 4
+        observation_space = gym.spaces.Box(low=0.0, high=height, shape=(obs_len,))
+        VecEnv.__init__(self, num_envs, observation_space, gym.spaces.Discrete(self.act_len))
+
+        self.plain = np.zeros((num_envs, width, length), dtype=np.int32)
+        self.volume = np.zeros(num_envs, dtype=np.int64)
+        self.counter = np.zeros(num_envs, dtype=np.int64)
+        self.queue = np.zeros((num_envs, 1, 3), dtype=np.int32)
+        self.queue_len = np.ones(num_envs, dtype=np.int64)
+        self.cursor = np.zeros(num_envs, dtype=np.int64)
+        self.actions = None
+
+    def _load_sequence(self, env):
+        # only the dims of the boxes are kept, sequences longer than the queue grow it
+        seq = np.asarray([box[:3] for box in self.box_creator.sample_sequence()], dtype=np.int32)
+        if len(seq) > self.queue.shape[1]:
+            queue = np.zeros((self.num_envs, len(seq), 3), dtype=np.int32)
+            queue[:, :self.queue.shape[1]] = self.queue
+            self.queue = queue
+        self.queue[env, :len(seq)] = seq
+        self.queue_len[env] = len(seq)
+        self.cursor[env] = 0
+
+    def _reset_envs(self, envs):
+        for env in envs:
+            self._load_sequence(env)
+        self.plain[envs] = 0
+        self.volume[envs] = 0
+        self.counter[envs] = 0
+
+    @property
+    def next_boxes(self):
+        index = np.minimum(self.cursor, self.queue_len - 1)
+        return self.queue[np.arange(self.num_envs), index]
+
+    @property
+    def cur_observation(self):
+        if self.compact_obs:
+            obs = np.empty((self.num_envs, self.area + 3), dtype=np.float32)
+            obs[:, :self.area] = self.plain.reshape((self.num_envs, -1))
+            obs[:, self.area:] = self.next_boxes
+            return obs
+        obs = np.empty((self.num_envs, 4, self.area), dtype=np.float32)
+        obs[:, 0] = self.plain.reshape((self.num_envs, -1))
+        obs[:, 1:] = self.next_boxes[:, :, None]
+        return obs.reshape((self.num_envs, -1))
+
+    def get_masks(self):
+        # the same masks the other VecEnvs collect from env.cur_mask
+        masks = batch_action_masks(self.plain, self.next_boxes, self.bin_size[2],
+                                   rotation=self.can_rotate, strict_corners=False)
+        return masks.astype(np.float32)
+
+    def reset(self):
+        self._reset_envs(np.arange(self.num_envs))
+        return self.cur_observation
+
+    def step_async(self, actions):
+        self.actions = np.asarray(actions).reshape((self.num_envs, -1))[:, 0].astype(np.int64)
+
+    def step_wait(self):
+        width, length, height = self.bin_size
+        n = self.num_envs
+        batch = np.arange(n)
+        idx = self.actions
+        boxes = self.next_boxes
+        # like PackingGame.step, an index above the area is the rotated box
+        rotate = idx > self.area
+        assert self.can_rotate or not rotate.any()
+        idx = np.where(rotate, idx - self.area, idx)
+        x = np.where(rotate, boxes[:, 1], boxes[:, 0])
+        y = np.where(rotate, boxes[:, 0], boxes[:, 1])
+        z = boxes[:, 2]
+        lx, ly = idx // length, idx % length
+        fits = (lx >= 0) & (ly >= 0) & (lx + x <= width) & (ly + y <= length)
+
+        # every footprint padded to the largest one, cells outside it read as -1
+        ox = np.arange(max(x.max(), 1))[None, :, None]
+        oy = np.arange(max(y.max(), 1))[None, None, :]
+        inside = (ox < x[:, None, None]) & (oy < y[:, None, None])
+        cx = np.clip(lx[:, None, None] + ox, 0, width - 1)
+        cy = np.clip(ly[:, None, None] + oy, 0, length - 1)
+        rec = np.where(inside, self.plain[batch[:, None, None], cx, cy], -1)
+        max_h = rec.max(axis=(1, 2))
+        max_area = np.count_nonzero(rec == max_h[:, None, None], axis=(1, 2))
+        hx, hy = np.clip(lx + x - 1, 0, width - 1), np.clip(ly + y - 1, 0, length - 1)
+        sx, sy = np.clip(lx, 0, width - 1), np.clip(ly, 0, length - 1)
+        corners = (self.plain[batch, sx, sy], self.plain[batch, hx, sy],
+                   self.plain[batch, sx, hy], self.plain[batch, hx, hy])
+        placed = fits & support_rule(max_h, max_area, x * y, corners, z, height, strict_corners=True)
+
+        top = max_h + z
+        cells = inside & placed[:, None, None]
+        shape = cells.shape
+        self.plain[np.broadcast_to(batch[:, None, None], shape)[cells], np.broadcast_to(cx, shape)[cells],
+                   np.broadcast_to(cy, shape)[cells]] = np.broadcast_to(top[:, None, None], shape)[cells]
+        self.volume += np.where(placed, x * y * z, 0)
+        self.counter += placed
+        self.cursor += placed
+
+        box_ratio = boxes.prod(axis=1) / (width * length * height)
+        far_distance_reward = np.exp(-1.0 * np.sqrt(lx ** 2 + ly ** 2) / np.linalg.norm(self.bin_size[:2]))
+        rewards = np.where(placed, box_ratio * 10 + far_distance_reward * 2.0, 0.0).astype(np.float32)
+        dones = ~placed
+        ratios = self.volume / (width * length * height)
+        infos = [{'counter': int(self.counter[e]), 'ratio': float(ratios[e])} for e in range(n)]
+        for e in np.flatnonzero(dones):
+            infos[e]['mask'] = np.ones(shape=self.act_len)
+
+        self._reset_envs(np.flatnonzero(dones))
+        return self.cur_observation, rewards, dones, infos
@@ -1,15 +1,32 @@
 from .space import Space
+from .feasibility import get_action_mask
 import numpy as np
 import copy
 import gym
-from .cutCreator import CuttingBoxCreator
-from .mdCreator  import MDlayerBoxCreator
+from .cutCreator import FastCuttingBoxCreator
+from .mdCreator  import FastMDlayerBoxCreator
 from .binCreator import RandomBoxCreator, LoadBoxCreator, BoxCreator
 
+def make_box_creator(data_type, container_size, box_set, enable_rotation=False):
+    # the generator used for training with --item_seq data_type
+    assert box_set is not None
+    if data_type == 'rs':
+        print('using random data')
+        return RandomBoxCreator(box_set)
+    elif data_type == 'cut1':
+        low = list(box_set[0])
+        up = list(box_set[-1])
+        low.extend(up)
+        print(low)
+        return FastCuttingBoxCreator(container_size, low, enable_rotation)
+    elif data_type == 'cut2':
+        print('using md data')
+        return FastMDlayerBoxCreator(container_size, [box_set[0][0], box_set[-1][0]])
+
 class PackingGame(gym.Env):
     def __init__(self, box_creator=None, container_size = (20, 20, 20),
                  box_set = None, data_name = None, test = False,
-                 data_type = 'cut1', enable_rotation=False, **kwargs):
+                 data_type = 'cut1', enable_rotation=False, compact_obs=False, **kwargs):
         self.box_creator = box_creator
         self.bin_size = container_size
         self.area = int(self.bin_size[0] * self.bin_size[1])
@@ -17,30 +34,22 @@ class PackingGame(gym.Env):
             self.h_comp = kwargs['h_comp']
         else:
             self.h_comp = False
-        self.space = Space(*self.bin_size, h_comp=self.h_comp)
+        # keep the masks of the seen box types and recheck only what a placement touches, for large containers
+        self.mask_cache = kwargs.get('mask_cache', False)
+        self.space = Space(*self.bin_size, h_comp=self.h_comp, mask_cache=self.mask_cache)
         self.can_rotate = enable_rotation
 
         if not test and box_creator is None:
-            assert box_set is not None
-            if data_type == 'rs':
-                print('using random data')
-                self.box_creator = RandomBoxCreator(box_set)
-            elif data_type == 'cut1':
-                low = list(box_set[0])
-                up = list(box_set[-1])
-                low.extend(up)
-                print(low)
-                self.box_creator = CuttingBoxCreator(container_size, low, self.can_rotate)
-            elif data_type == 'cut2':
-                print('using md data')
-                self.box_creator = MDlayerBoxCreator(container_size, [box_set[0][0], box_set[-1][0]])
+            self.box_creator = make_box_creator(data_type, container_size, box_set, self.can_rotate)
             assert isinstance(self.box_creator, BoxCreator)
 
         if test:
             self.box_creator = LoadBoxCreator(data_name)
 
         self.act_len = self.area * (1+self.can_rotate)
-        self.obs_len = self.area * (1+3)
+        # compact observations hold the next box's dims instead of three planes filled with them
+        self.compact_obs = compact_obs
+        self.obs_len = self.area + 3 if compact_obs else self.area * (1+3)
         self.action_space = gym.spaces.Discrete(self.act_len)
         self.observation_space = gym.spaces.Box(low=0.0, high=self.space.height, shape=(self.obs_len,))
         
@@ -56,19 +65,52 @@ class PackingGame(gym.Env):
         z_plain = np.ones(self.space.plain_size[:2], dtype=np.int32) * self.next_box[2]
         return (x_plain, y_plain, z_plain)
 
-    def reset(self):
-        self.box_creator.reset()
-        self.space = Space(*self.bin_size, h_comp=self.h_comp)
+    def reset(self, index=None):
+        # index picks a sequence of the test dataset, by default the next one is used
+        if index is None:
+            self.box_creator.reset()
+        else:
+            self.box_creator.reset(index)
+        self.space = Space(*self.bin_size, h_comp=self.h_comp, mask_cache=self.mask_cache)
         self.box_creator.generate_box_size()
         return self.cur_observation
 
+    def snapshot(self):
+        """
+        Cheap replacement of copy.deepcopy(env) for search: only the height
+        map, the placed boxes and the box queue are saved.
+        """
+        return self.space.snapshot(), self.box_creator.snapshot()
+
+    def restore(self, state):
+        space_state, creator_state = state
+        self.space.restore(space_state)
+        self.box_creator.restore(creator_state)
+
+    def clone(self):
+        # an independent env sharing the read-only parts (dataset, settings)
+        env = copy.copy(self)
+        env.space = self.space.clone()
+        env.box_creator = self.box_creator.clone()
+        return env
+
     @property
     def cur_observation(self):
         hmap = self.space.plain[:, :, 0]
+        if self.compact_obs:
+            return np.concatenate((hmap.reshape((-1,)), np.asarray(self.next_box[:3], dtype=hmap.dtype)))
         # mask = self.get_possible_position()
         size = self.get_box_plain()
         return np.reshape(np.stack((hmap,  *size)), newshape=(-1,))
 
+    @property
+    def cur_mask(self):
+        # the action mask of the next box, checked with the same rule as acktr.utils.get_possible_position
+        hmap = self.space.plain[:, :, 0]
+        if self.space.masks is not None:
+            return self.space.masks.action_mask(hmap, self.next_box, rotation=self.can_rotate, strict_corners=False)
+        return get_action_mask(hmap, self.next_box, self.bin_size[2], rotation=self.can_rotate, strict_corners=False)
+
     @property
     def next_box(self):
         return self.box_creator.preview(1)[0]
@@ -78,18 +120,7 @@ class PackingGame(gym.Env):
         y = self.next_box[1]
         z = self.next_box[2]
 
-        if plain is None:
-            plain = self.space.plain
-
-        width = self.space.plain_size[0]
-        length = self.space.plain_size[1]
-
-        action_mask = np.zeros(shape=(width, length), dtype=np.int32)
-        
-        for i in range(width-x+1):
-            for j in range(length-y+1):
-                if self.space.check_box(plain, x, y, i, j, z) >= 0:
-                    action_mask[i, j] = 1
+        action_mask = self.space.get_possible_position(x, y, z, plain)
 
         if action_mask.sum() == 0:
             action_mask[:, :] = 1
@@ -1,6 +1,23 @@
 import numpy as np
 import copy
 import torch
+from .dataset import SequenceDataset
+
+# datasets loaded by this process, keyed by file name
+_datasets = {}
+
+def load_dataset(data_name):
+    """
+    Load a box sequence dataset once per process and keep it for later
+    resets. Workers forked after the first load inherit it instead of
+    parsing the file again. Columnar .npz datasets are memory-mapped.
+    """
+    if data_name not in _datasets:
+        if data_name.endswith('.npz'):
+            _datasets[data_name] = SequenceDataset(data_name)
+        else:
+            _datasets[data_name] = torch.load(data_name)
+    return _datasets[data_name]
 
 class BoxCreator(object):
     def __init__(self):
@@ -21,6 +38,21 @@ class BoxCreator(object):
         assert len(self.box_list) >= 0
         self.box_list.pop(0)
 
+    def snapshot(self):
+        """
+        Save the generation state within the current episode. Box sizes are
+        never modified, so copying the lists is enough.
+        """
+        return list(self.box_list)
+
+    def restore(self, state):
+        self.box_list = list(state)
+
+    def clone(self):
+        creator = copy.copy(self)
+        creator.restore(self.snapshot())
+        return creator
+
 class RandomBoxCreator(BoxCreator):
     default_box_set = []
     for i in range(5):
@@ -54,21 +86,41 @@ class LoadBoxCreator(BoxCreator):
         print("load data set successfully!")
         self.index = -1
         self.box_index = 0
-        self.traj_nums = len(torch.load(self.data_name))
+        self.box_trajs = load_dataset(self.data_name)
+        self.traj_nums = len(self.box_trajs)
 
     def reset(self, index=None):
         self.box_list.clear()
-        box_trajs = torch.load(self.data_name)
         self.recorder = []
         if index is None:
             self.index += 1
         else:
             self.index = index
-        self.boxes = box_trajs[self.index]
+        self.boxes = self.box_trajs[self.index]
         self.box_index = 0
-        self.box_set = self.boxes
+        # the loaded sequences are shared, extend a copy
+        self.box_set = list(self.boxes)
         self.box_set.append([28, 28, 28, 0])
 
+    def snapshot(self):
+        return super().snapshot(), self.box_index, len(self.recorder)
+
+    def restore(self, state):
+        box_list, self.box_index, recorded = state
+        super().restore(box_list)
+        self.recorder = self.recorder[:recorded]
+
+    def __getstate__(self):
+        # copies and pickles (e.g. the tasks of a SearchPool) only carry the dataset's name,
+        # load_dataset hands out the copy this process already holds
+        state = self.__dict__.copy()
+        del state['box_trajs']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.box_trajs = load_dataset(self.data_name)
+
     def generate_box_size(self, **kwargs):
         if self.box_index < len(self.box_set):
             self.box_list.append(self.box_set[self.box_index])
@@ -51,6 +51,24 @@ class CuttingBoxCreator(BoxCreator):
         self._cut_box(*self.box_range)
         self._add_candidate()
 
+    def snapshot(self):
+        return super().snapshot(), self.plain.copy(), list(self.meta_list), list(self.candidates)
+
+    def sample_sequence(self):
+        # a whole new sequence, ending with the bin size as generate_box_size does
+        self.reset()
+        while len(self.candidates) > 0:
+            self.generate_box_size()
+        self.generate_box_size()
+        return list(self.box_list)
+
+    def restore(self, state):
+        box_list, plain, meta_list, candidates = state
+        super().restore(box_list)
+        self.plain = plain.copy()
+        self.meta_list = list(meta_list)
+        self.candidates = list(candidates)
+
     def _check_box(self, box, low_x, low_y, low_z, high_x, high_y, high_z):
         x_flag = box.x < low_x or box.x > high_x
         y_flag = box.y < low_y or box.y > high_y
@@ -127,6 +145,114 @@ class CuttingBoxCreator(BoxCreator):
         self._update(box)
         self._add_candidate()
 
+
+class FastCuttingBoxCreator(BoxCreator):
+    """
+    CuttingBoxCreator without the per-pass deepcopies and rescans. Meta boxes
+    are (x, y, z, lx, ly, lz) tuples and are grouped by their bottom lz.
+    Instead of checking a height plain, every meta box counts the grids of
+    its footprint that are still unsupported, and after a box is generated
+    only the meta boxes lying on its top are updated. The random numbers
+    are drawn in the same order as CuttingBoxCreator, so a seed gives the
+    same sequence with both creators.
+    """
+    def __init__(self, bin_size, box_range, rotation=False):
+        super().__init__()
+        self.bin_size = bin_size
+        self.box_range = box_range
+        self.rotation = rotation
+        self.reset()
+
+    def reset(self):
+        self.box_list.clear()
+        self.meta_list = self._cut_box(*self.box_range)
+        self.meta = np.array(self.meta_list, dtype=np.int64).reshape((-1, 6))
+        bottom = self.meta[:, 5]
+        self.levels = {int(lz): np.flatnonzero(bottom == lz) for lz in np.unique(bottom)}
+        self.unsupported = self.meta[:, 0] * self.meta[:, 1]
+        self.unsupported[bottom == 0] = 0
+        self.candidates = self.levels.get(0, np.zeros(0, dtype=np.int64)).tolist()
+
+    def snapshot(self):
+        # meta_list, meta and levels don't change within an episode
+        return super().snapshot(), self.unsupported.copy(), list(self.candidates)
+
+    def restore(self, state):
+        box_list, unsupported, candidates = state
+        super().restore(box_list)
+        self.unsupported = unsupported.copy()
+        self.candidates = list(candidates)
+
+    def sample_sequence(self):
+        self.reset()
+        while len(self.candidates) > 0:
+            self.generate_box_size()
+        self.generate_box_size()
+        return list(self.box_list)
+
+    def _cut_box(self, low_x, low_y, low_z, high_x, high_y, high_z):
+        # same passes as CuttingBoxCreator._cut_box, the split boxes are fresh tuples so nothing is copied
+        low = (low_x, low_y, low_z)
+        high = (high_x, high_y, high_z)
+        meta_list = [tuple(self.bin_size) + (0, 0, 0)]
+        split = True
+        while split:
+            split = False
+            new_list = []
+            for box in meta_list:
+                df_list = [df for df in range(3) if box[df] < low[df] or box[df] > high[df]]
+                if len(df_list) == 0:
+                    new_list.append(box)
+                    continue
+                df = random.choice(df_list)
+                assert low[df] <= box[df] - low[df]
+                pos = random.randint(low[df], box[df] - low[df])
+                box1, box2 = list(box), list(box)
+                box1[df] = pos
+                box2[df] = box[df] - pos
+                box2[df + 3] += pos
+                new_list.append(tuple(box1))
+                new_list.append(tuple(box2))
+                split = True
+            meta_list = new_list
+        return meta_list
+
+    def _update(self, index):
+        x, y, z, lx, ly, lz = self.meta_list[index]
+        above = self.levels.get(lz + z)
+        if above is None:
+            return
+        meta = self.meta[above]
+        ox = np.minimum(meta[:, 3] + meta[:, 0], lx + x) - np.maximum(meta[:, 3], lx)
+        oy = np.minimum(meta[:, 4] + meta[:, 1], ly + y) - np.maximum(meta[:, 4], ly)
+        overlap = np.maximum(ox, 0) * np.maximum(oy, 0)
+        touched = overlap > 0
+        if not touched.any():
+            return
+        above = above[touched]
+        self.unsupported[above] -= overlap[touched]
+        # levels are in meta_list order, which is the order CuttingBoxCreator adds candidates in
+        self.candidates.extend(above[self.unsupported[above] == 0].tolist())
+
+    def generate_box_size(self, **kwargs):
+        if len(self.candidates) == 0:
+            self.box_list.append(self.bin_size)
+            return
+        idx = random.randint(0, len(self.candidates) - 1)
+        index = self.candidates.pop(idx)
+        x, y, z = self.meta_list[index][:3]
+        if not self.rotation:
+            self.box_list.append((x, y, z))
+        else:
+            rd = np.random.rand()
+            # randomly rotate boxes
+            if rd < 0.5:
+                self.box_list.append((x, y, z))
+            else:
+                self.box_list.append((y, x, z))
+        self._update(index)
+
+
 class LoadBoxCreator(BoxCreator):
     def __init__(self, data_name = None):
         super().__init__()
@@ -0,0 +1,127 @@
+import argparse
+import struct
+import zipfile
+import numpy as np
+import torch
+
+
+def pack_sequences(sequences, width=None):
+    """
+    Pack box sequences into the columnar arrays: one int32 array with the
+    dims of every box (one row per box, zero padded to width columns) and
+    an int64 offsets array, sequence i being boxes[offsets[i]:offsets[i + 1]].
+    """
+    lengths = [len(seq) for seq in sequences]
+    offsets = np.zeros(len(sequences) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(lengths)
+    rows = [box for seq in sequences for box in seq]
+    if width is None:
+        width = max((len(box) for box in rows), default=3)
+    boxes = np.zeros((len(rows), width), dtype=np.int32)
+    for i, box in enumerate(rows):
+        boxes[i, :len(box)] = box
+    return boxes, offsets
+
+
+def write_dataset(path, sequences, width=None):
+    """
+    Write box sequences in the columnar format (see pack_sequences). The
+    arrays are stored uncompressed in an .npz, so they can be memory-mapped.
+    """
+    boxes, offsets = pack_sequences(sequences, width)
+    np.savez(path, boxes=boxes, offsets=offsets)
+
+
+def volume_ratios(boxes, offsets, container_size):
+    # total box volume of every sequence over the container volume, check_boxgen for a whole dataset
+    volumes = np.prod(boxes[:, :3].astype(np.int64), axis=1)
+    totals = np.zeros(len(volumes) + 1, dtype=np.int64)
+    totals[1:] = np.cumsum(volumes)
+    return (totals[offsets[1:]] - totals[offsets[:-1]]) / np.prod(container_size)
+
+
+def _mmap_member(path, name):
+    # np.savez stores the members uncompressed, so the .npy data can be mapped right out of the zip
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + '.npy')
+        assert info.compress_type == zipfile.ZIP_STORED, 'the dataset must be written without compression'
+    with open(path, 'rb') as f:
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_len, extra_len = struct.unpack('<HH', header[26:30])
+        f.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    order = 'F' if fortran_order else 'C'
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape, order=order)
+
+
+class SequenceDataset(object):
+    """
+    Read-only, memory-mapped view of a dataset written by write_dataset.
+    Only the accessed sequences are paged in, and forked workers share
+    the mapped pages. Indexing returns a sequence as a list of box lists,
+    like the .pt datasets.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.boxes = _mmap_member(path, 'boxes')
+        self.offsets = np.array(_mmap_member(path, 'offsets'))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('sequence index out of range')
+        return self.boxes[self.offsets[index]:self.offsets[index + 1]].tolist()
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+
+def convert(src, dst):
+    # .pt (pickled nested lists) to the columnar .npz format
+    sequences = torch.load(src)
+    write_dataset(dst, sequences)
+    return len(sequences)
+
+
+def merge_datasets(srcs, dst, block=1 << 20):
+    """
+    Concatenate columnar datasets into one, copying at most block boxes at
+    a time so the output can be larger than memory
+    """
+    parts = [SequenceDataset(src) for src in srcs]
+    width = max((part.boxes.shape[1] for part in parts), default=3)
+    total = sum(len(part.boxes) for part in parts)
+    offsets = [np.zeros(1, dtype=np.int64)]
+    for part in parts:
+        offsets.append(part.offsets[1:] + offsets[-1][-1])
+    header = {'descr': np.lib.format.dtype_to_descr(np.dtype(np.int32)), 'fortran_order': False, 'shape': (total, width)}
+    with zipfile.ZipFile(dst, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        with archive.open('boxes.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array_header_2_0(f, header)
+            for part in parts:
+                for start in range(0, len(part.boxes), block):
+                    rows = np.zeros((min(block, len(part.boxes) - start), width), dtype=np.int32)
+                    rows[:, :part.boxes.shape[1]] = part.boxes[start:start + block]
+                    f.write(rows.tobytes())
+        with archive.open('offsets.npy', 'w', force_zip64=True) as f:
+            np.lib.format.write_array(f, np.concatenate(offsets))
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert a .pt box sequence dataset to the columnar .npz format')
+    parser.add_argument('src', help='the .pt dataset')
+    parser.add_argument('dst', help='the .npz file to write')
+    args = parser.parse_args()
+    num = convert(args.src, args.dst)
+    print('converted %d sequences: %s -> %s' % (num, args.src, args.dst))
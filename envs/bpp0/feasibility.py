@@ -0,0 +1,266 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def support_rule(max_h, max_area, area, corners, z, height, strict_corners=True):
+    """
+    Stability rule shared by the scalar and the vectorized checks. Works on
+    python scalars as well as on arrays of candidate positions (NumPy
+    scalars work too but are many times slower than python ints).
+
+    Args:
+        max_h: the max height under the footprint
+        max_area: number of grids under the footprint at height max_h
+        area: footprint area (x * y)
+        corners: heights of the four footprint corners
+        z: the box's height
+        height: the bin's height
+        strict_corners: also require three of the four corners to be level
+            with each other (the rule used by Space.check_box)
+    """
+    r00, r10, r01, r11 = corners
+    ratio = max_area / area
+    top = (r00 == max_h) * 1 + (r10 == max_h) * 1 + (r01 == max_h) * 1 + (r11 == max_h) * 1
+    valid = (ratio > 0.95) | ((top == 3) & (ratio > 0.85)) | ((top == 4) & (ratio > 0.50))
+    valid = valid & (max_h + z <= height)
+    if strict_corners:
+        if isinstance(max_h, np.ndarray):
+            rm = np.maximum(np.maximum(r00, r10), np.maximum(r01, r11))
+        else:
+            rm = max(r00, r10, r01, r11)
+        level = (r00 == rm) * 1 + (r10 == rm) * 1 + (r01 == rm) * 1 + (r11 == rm) * 1
+        valid = valid & (level >= 3)
+    return valid
+
+
+def check_footprint(rec, z, height, strict_corners=True):
+    """
+    Check a single footprint rec (x * y heights), return the height the box
+    lands at or -1 when the placement is unstable
+    """
+    x, y = rec.shape
+    max_h = int(np.max(rec))
+    assert max_h >= 0
+    max_area = int(np.count_nonzero(rec == max_h))
+    corners = (int(rec[0, 0]), int(rec[x - 1, 0]), int(rec[0, y - 1]), int(rec[x - 1, y - 1]))
+    if support_rule(max_h, max_area, x * y, corners, z, height, strict_corners):
+        return max_h
+    return -1
+
+
+def window_stats(hmap, x, y):
+    """
+    For every x * y footprint on the height map, get the max height, the
+    number of grids at that height and the heights of the four corners.
+    Each returned array has shape (width - x + 1, length - y + 1).
+    """
+    nx = hmap.shape[0] - x + 1
+    ny = hmap.shape[1] - y + 1
+    # separable sliding max: along x first, then along y
+    max_h = sliding_window_view(hmap, x, axis=0).max(axis=-1)
+    max_h = sliding_window_view(max_h, y, axis=1).max(axis=-1)
+    windows = sliding_window_view(hmap, (x, y))
+    max_area = np.count_nonzero(windows == max_h[:, :, None, None], axis=(2, 3))
+    corners = (hmap[:nx, :ny], hmap[x - 1:, :ny], hmap[:nx, y - 1:], hmap[x - 1:, y - 1:])
+    return max_h, max_area, corners
+
+
+def position_mask(hmap, x, y, z, height, strict_corners=True):
+    """
+    Return a (width, length) int32 mask with 1 for every stable FLB position
+    """
+    hmap = np.asarray(hmap)
+    mask = np.zeros(hmap.shape, dtype=np.int32)
+    if x > hmap.shape[0] or y > hmap.shape[1]:
+        return mask
+    max_h, max_area, corners = window_stats(hmap, x, y)
+    valid = support_rule(max_h, max_area, x * y, corners, z, height, strict_corners)
+    nx, ny = valid.shape
+    mask[:nx, :ny] = valid
+    return mask
+
+
+def get_action_mask(hmap, box_size, height, rotation=False, strict_corners=True):
+    """
+    Flattened action mask for placing box_size on the height map. With
+    rotation the mask of the rotated box is appended. If no position is
+    feasible every action is allowed.
+    """
+    x, y, z = int(box_size[0]), int(box_size[1]), int(box_size[2])
+    mask = position_mask(hmap, x, y, z, height, strict_corners).reshape((-1,))
+    if rotation:
+        rmask = position_mask(hmap, y, x, z, height, strict_corners).reshape((-1,))
+        mask = np.hstack((mask, rmask))
+    if mask.sum() == 0:
+        mask[:] = 1
+    return mask
+
+
+def _merge(m1, c1, m2, c2):
+    # (max, count at max) of the union of two disjoint ranges
+    m = np.maximum(m1, m2)
+    return m, c1 * (m1 == m) + c2 * (m2 == m)
+
+
+def _shift(a, step, axis, fill):
+    # a[..., i + step, ...] along axis, filled where it runs over the border
+    res = np.full_like(a, fill)
+    src = [slice(None)] * a.ndim
+    dst = [slice(None)] * a.ndim
+    src[axis] = slice(step, None)
+    dst[axis] = slice(0, a.shape[axis] - step)
+    res[tuple(dst)] = a[tuple(src)]
+    return res
+
+
+def _range_max_count(m, c, size, axis):
+    """
+    For every start position along axis (1 or 2) of the (n, width, length)
+    arrays m and c, merge the (max, count) pairs over the next size[k] cells
+    of map k. The window is split into disjoint power-of-two blocks, so each
+    map can use its own window size and the cost is O(n * area * log(size)).
+    """
+    blocks = [(m, c)]
+    while (1 << len(blocks)) <= size.max():
+        bm, bc = blocks[-1]
+        step = 1 << (len(blocks) - 1)
+        blocks.append(_merge(bm, bc, _shift(bm, step, axis, -1), _shift(bc, step, axis, 0)))
+
+    res_m = np.full_like(m, -1)
+    res_c = np.zeros_like(c)
+    offset = np.zeros(size.shape, dtype=np.int64)
+    dim = m.shape[axis]
+    start = np.arange(dim).reshape((1, -1, 1) if axis == 1 else (1, 1, -1))
+    for k in range(len(blocks) - 1, -1, -1):
+        use = ((size >> k) & 1).astype(bool)
+        if not use.any():
+            continue
+        bm, bc = blocks[k]
+        pos = start + offset[:, None, None]
+        inside = pos < dim
+        pos = np.minimum(pos, dim - 1)
+        bm = np.take_along_axis(bm, pos, axis=axis)
+        bc = np.take_along_axis(bc, pos, axis=axis)
+        use = use[:, None, None] & inside
+        bm = np.where(use, bm, -1)
+        bc = np.where(use, bc, 0)
+        res_m, res_c = _merge(res_m, res_c, bm, bc)
+        offset += ((size >> k) & 1) << k
+    return res_m, res_c
+
+
+def batch_position_masks(hmaps, box_sizes, height, strict_corners=True):
+    """
+    Batched position_mask: hmaps is (n, width, length), box_sizes is (n, 3)
+    and every height map gets its own box. The max height under each
+    footprint and the number of grids at that height are merged from
+    power-of-two blocks, first along x then along y, so the whole batch is
+    checked in O(n * area * log(box size)) without a loop over the maps.
+    """
+    hmaps = np.asarray(hmaps)
+    box_sizes = np.asarray(box_sizes).astype(np.int64)
+    n, width, length = hmaps.shape
+    x, y, z = box_sizes[:, 0], box_sizes[:, 1], box_sizes[:, 2]
+
+    ones = np.ones(hmaps.shape, dtype=np.int32)
+    max_h, max_area = _range_max_count(hmaps, ones, np.clip(x, 1, width), axis=1)
+    max_h, max_area = _range_max_count(max_h, max_area, np.clip(y, 1, length), axis=2)
+
+    batch = np.arange(n)[:, None, None]
+    lx = np.arange(width)[None, :, None]
+    ly = np.arange(length)[None, None, :]
+    hx = np.minimum(lx + x[:, None, None], width) - 1
+    hy = np.minimum(ly + y[:, None, None], length) - 1
+    corners = (hmaps[batch, lx, ly], hmaps[batch, hx, ly], hmaps[batch, lx, hy], hmaps[batch, hx, hy])
+    area = (x * y)[:, None, None]
+    valid = support_rule(max_h, max_area, area, corners, z[:, None, None], height, strict_corners)
+    valid = valid & (lx + x[:, None, None] <= width) & (ly + y[:, None, None] <= length)
+    return valid.astype(np.int32)
+
+
+def batch_action_masks(hmaps, box_sizes, height, rotation=False, strict_corners=True):
+    """
+    Batched get_action_mask, return a (n, action_len) int32 array
+    """
+    box_sizes = np.asarray(box_sizes)
+    n = box_sizes.shape[0]
+    masks = batch_position_masks(hmaps, box_sizes, height, strict_corners).reshape((n, -1))
+    if rotation:
+        rotated = box_sizes[:, [1, 0, 2]]
+        rmasks = batch_position_masks(hmaps, rotated, height, strict_corners).reshape((n, -1))
+        masks = np.hstack((masks, rmasks))
+    masks[masks.sum(axis=1) == 0] = 1
+    return masks
+
+
+class MaskCache(object):
+    """
+    Position masks of one height map for every box type asked for, keyed by
+    (x, y, z, strict_corners). A new box type is checked over the whole map.
+    A placement only marks, for every cached mask, the positions whose
+    footprint overlaps the changed rectangle, and they are rechecked the
+    next time that box type is asked for. The rule only looks inside the
+    footprint, so the other positions keep their value.
+    """
+    _CALL_COST = 128
+
+    def __init__(self, height):
+        self.height = height
+        self.masks = {}
+        self.dirty = {}
+
+    def clear(self):
+        self.masks.clear()
+        self.dirty.clear()
+
+    def position_mask(self, hmap, x, y, z, strict_corners=True):
+        key = (int(x), int(y), int(z), strict_corners)
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = position_mask(hmap, key[0], key[1], key[2], self.height, strict_corners)
+            self.masks[key] = mask
+            self.dirty[key] = []
+        elif self.dirty[key]:
+            self._recheck(hmap, key, mask, self.dirty[key])
+            self.dirty[key] = []
+        return mask.copy()
+
+    def action_mask(self, hmap, box_size, rotation=False, strict_corners=True):
+        # get_action_mask from the cached masks
+        x, y, z = int(box_size[0]), int(box_size[1]), int(box_size[2])
+        mask = self.position_mask(hmap, x, y, z, strict_corners).reshape((-1,))
+        if rotation:
+            rmask = self.position_mask(hmap, y, x, z, strict_corners).reshape((-1,))
+            mask = np.hstack((mask, rmask))
+        if mask.sum() == 0:
+            mask[:] = 1
+        return mask
+
+    def update(self, hmap, lx, ly, x, y):
+        """
+        The heights of hmap[lx:lx + x, ly:ly + y] changed, mark every cached
+        position whose footprint overlaps them
+        """
+        width, length = hmap.shape
+        for (bx, by, bz, strict_corners), rects in self.dirty.items():
+            i0, i1 = max(lx - bx + 1, 0), min(lx + x - 1, width - bx)
+            j0, j1 = max(ly - by + 1, 0), min(ly + y - 1, length - by)
+            if i0 <= i1 and j0 <= j1:
+                rects.append((i0, i1, j0, j1))
+
+    def _recheck(self, hmap, key, mask, rects):
+        bx, by, bz, strict_corners = key
+        # a call costs about as much as checking _CALL_COST positions, so take the cheapest of the
+        # rectangles one by one, their bounding box in one pass or the whole map
+        box = (min(r[0] for r in rects), max(r[1] for r in rects), min(r[2] for r in rects), max(r[3] for r in rects))
+        cost = sum((r[1] - r[0] + 1) * (r[3] - r[2] + 1) + self._CALL_COST for r in rects)
+        box_cost = (box[1] - box[0] + 1) * (box[3] - box[2] + 1) + self._CALL_COST
+        if box_cost < cost:
+            rects, cost = [box], box_cost
+        if cost >= mask.size:
+            mask[...] = position_mask(hmap, bx, by, bz, self.height, strict_corners)
+            return
+        for i0, i1, j0, j1 in rects:
+            region = position_mask(hmap[i0:i1 + bx, j0:j1 + by], bx, by, bz, self.height, strict_corners)
+            mask[i0:i1 + 1, j0:j1 + 1] = region[:i1 - i0 + 1, :j1 - j0 + 1]
+
@@ -162,6 +162,96 @@ class MDlayerBoxCreator(BoxCreator):
         self.default_box_set.append([self.bin_size[0], self.bin_size[1], self.bin_size[2], 0])
         self.box_set = self.default_box_set
 
+    def snapshot(self):
+        return super().snapshot(), self.index
+
+    def sample_sequence(self):
+        # a whole new sequence, ending with the bin-sized box
+        self.reset()
+        return list(self.box_set)
+
+    def restore(self, state):
+        box_list, self.index = state
+        super().restore(box_list)
+
+    def generate_box_size(self, **kwargs):
+        self.box_list.append(self.box_set[self.index])
+        self.index += 1
+
+def md_cut(container_size, given_bound):
+    """
+    Cut the container into boxes with every edge in given_bound, the same
+    splits as bin.gen_benchmark with (x, y, z, bottom) integer tuples and
+    no geometry. The old split drew an axis and a position in 1..size and
+    gave up for this pass when a part came out below the lower bound. Here
+    one draw decides whether the attempt fails, and a successful split
+    draws the axis weighted by its acceptance rate and the position from
+    the valid range, which gives the same distribution. The passes visit
+    the boxes like gen_benchmark, including the box skipped after each
+    removal, so the order within a layer is kept too. Returns the boxes
+    sorted by their bottom.
+    """
+    low, high = given_bound
+    container = (container_size[0], container_size[1], container_size[2], 0)
+    boxes = []
+    invalid = []
+    (boxes if max(container[:3]) <= high else invalid).append(container)
+    while invalid:
+        i = 0
+        while i < len(invalid):
+            box = invalid[i]
+            flags = [df for df in range(3) if box[df] > high]
+            weights = [max(box[df] - 2 * low + 1, 0) / box[df] for df in flags]
+            if sum(weights) == 0:
+                raise ValueError('box %s can not be cut into edges within %s' % (box[:3], given_bound))
+            if random.random() >= sum(weights) / len(flags):
+                i += 1
+                continue
+            df = random.choices(flags, weights)[0]
+            pos = random.randint(low, box[df] - low)
+            box1, box2 = list(box), list(box)
+            box1[df] = pos
+            box2[df] = box[df] - pos
+            if df == 2:
+                box2[3] += pos
+            del invalid[i]
+            for sub_box in (tuple(box1), tuple(box2)):
+                (boxes if max(sub_box[:3]) <= high else invalid).append(sub_box)
+            # the removal shifts the next box to i, gen_benchmark's loop skips it
+            i += 1
+    boxes.sort(key=lambda box: box[3])
+    return boxes
+
+
+class FastMDlayerBoxCreator(BoxCreator):
+    """
+    MDlayerBoxCreator built on md_cut, the sequence is ordered layer by layer
+    from the bottom of the container
+    """
+    def __init__(self, container_size, given_bound):
+        super().__init__()
+        self.given_bound = given_bound
+        self.bin_size = container_size
+        self.index = 0
+        self.box_set = []
+
+    def reset(self):
+        self.box_list.clear()
+        self.index = 0
+        self.box_set = [[x, y, z, 0] for x, y, z, _ in md_cut(self.bin_size, self.given_bound)]
+        self.box_set.append([self.bin_size[0], self.bin_size[1], self.bin_size[2], 0])
+
+    def snapshot(self):
+        return super().snapshot(), self.index
+
+    def sample_sequence(self):
+        self.reset()
+        return list(self.box_set)
+
+    def restore(self, state):
+        box_list, self.index = state
+        super().restore(box_list)
+
     def generate_box_size(self, **kwargs):
         self.box_list.append(self.box_set[self.index])
-        self.index += 1
\ No newline at end of file
+        self.index += 1
@@ -1,6 +1,6 @@
 import numpy as np
-from functools import reduce
 import copy, time
+from .feasibility import check_footprint, position_mask, MaskCache
 
 
 class Box(object):
@@ -9,6 +9,8 @@ class Box(object):
         lx, ly, lz: a box's position represented by its front-left-bottom (FLB) corner
         x, y, z: a box's length, width, and height
     """
+    __slots__ = ('x', 'y', 'z', 'lx', 'ly', 'lz', 'h_delta')
+
     def __init__(self, x, y, z, lx, ly, lz, h_delta):
         self.x = x
         self.y = y
@@ -27,26 +29,34 @@ class Space(object):
     Args:
         width, length, height: the bin's size
     """
-    def __init__(self, width=10, length=10, height=10, h_comp=False):
+    def __init__(self, width=10, length=10, height=10, h_comp=False, mask_cache=False):
         self.plain_size = np.array([width, length, height])
         self.plain = np.zeros(shape=(width, length, 2), dtype=np.int32) # last dim includes total height of the grid and a number in [0, 100) representing the filled grid height delta (unit: %) for the toppest box on the grid
         self.boxes = []
         self.flags = [] # record rotation information
+        self.volume = 0 # total volume of the placed boxes
         self.height = height
         self.h_comp = h_comp    # height delta 
+        # masks of the box types seen so far, updated by drop_box. Only pays off on large plains
+        self.masks = MaskCache(height) if mask_cache else None
 
     def print_height_graph(self):
         print(self.plain)
 
     def get_height_graph(self):
-        plain = np.zeros(shape=self.plain_size[:2], dtype=np.int32)
+        plain = np.zeros(shape=(self.plain_size[0], self.plain_size[1], 2), dtype=np.int32)
         for box in self.boxes:
-            plain = self.update_height_graph(plain, box)
-        return plain
+            self.update_height_graph(plain, box, inplace=True)
+        return plain[:, :, 0]
 
     # @staticmethod
-    def update_height_graph(self, plain, box):
-        plain = copy.deepcopy(plain)
+    def update_height_graph(self, plain, box, inplace=False):
+        """
+        Put the box on the plain. Only the box's footprint is touched, the
+        plain is updated in place if inplace is set, otherwise a copy is returned.
+        """
+        if not inplace:
+            plain = plain.copy()
         le = box.lx
         ri = box.lx + box.x
         up = box.ly
@@ -73,13 +83,37 @@ class Space(object):
         return plain
 
     def get_box_list(self):
-        vec = list()
-        for box in self.boxes:
-            vec += box.standardize()
-        return vec
+        return [v for box in self.boxes for v in box.standardize()]
 
     def get_plain(self):
-        return copy.deepcopy(self.plain)
+        return self.plain.copy()
+
+    def snapshot(self):
+        """
+        Save the current state. Placed boxes are never modified, so only the
+        plain is copied and the box list is restored by truncation.
+        """
+        return self.plain.copy(), len(self.boxes), self.volume, self.height
+
+    def clone(self):
+        space = copy.copy(self)
+        space.plain = self.plain.copy()
+        if self.masks is not None:
+            space.masks = MaskCache(self.plain_size[2])
+        space.boxes = list(self.boxes)
+        space.flags = list(self.flags)
+        return space
+
+    def restore(self, state):
+        plain, box_num, volume, height = state
+        assert box_num <= len(self.boxes)
+        self.plain[...] = plain
+        if self.masks is not None:
+            self.masks.clear()
+        del self.boxes[box_num:]
+        del self.flags[box_num:]
+        self.volume = volume
+        self.height = height
 
     def get_action_space(self):
         return self.plain_size[0] * self.plain_size[1]
@@ -141,38 +175,18 @@ class Space(object):
         if lx < 0 or ly < 0:
             return -1
         rec = plain[lx:lx+x, ly:ly+y, 0]
-        r00 = rec[0,0]
-        r10 = rec[x-1,0]
-        r01 = rec[0,y-1]
-        r11 = rec[x-1,y-1]
-        rm = max(r00,r10,r01,r11)
-        sc = int(r00==rm)+int(r10==rm)+int(r01==rm)+int(r11==rm)
-        if sc < 3:
-            return -1
-        # get the max height
-        max_h = np.max(rec)
-        # check area and corner
-        max_area = np.sum(rec==max_h)
-        area = x * y
-
-        # check boundary
-        assert max_h >= 0
-        if max_h + z > self.height:
-            return -1
-     
-        if max_area/area > 0.95:
-            return max_h
-        if rm == max_h and sc == 3 and max_area/area > 0.85:
-            return max_h
-        if rm == max_h and sc == 4 and max_area/area > 0.50:
-            return max_h
+        return check_footprint(rec, z, self.height)
 
-        return -1
+    def get_possible_position(self, x, y, z, plain=None):
+        if plain is None:
+            if self.masks is not None:
+                return self.masks.position_mask(self.plain[:, :, 0], x, y, z)
+            plain = self.plain
+        return position_mask(plain[:, :, 0], x, y, z, self.height)
 
     def get_ratio(self):
-        vo = reduce(lambda x, y: x+y, [box.x * box.y * box.z for box in self.boxes], 0.0)
         mx = self.plain_size[0] * self.plain_size[1] * self.plain_size[2]
-        ratio = vo / mx
+        ratio = self.volume / mx
         assert ratio <= 1.0
         return ratio
 
@@ -197,12 +211,14 @@ class Space(object):
             y = box_size[0]
         z = box_size[2]
         h_delta = box_size[3]
-        plain = self.plain
-        new_h = self.check_box(plain, x, y, lx, ly, z)
+        new_h = self.check_box(self.plain, x, y, lx, ly, z)
         if new_h != -1:
             self.boxes.append(Box(x, y, z, lx, ly, new_h, h_delta))
             self.flags.append(flag)
-            self.plain = self.update_height_graph(plain, self.boxes[-1])
+            self.volume += x * y * z
+            self.update_height_graph(self.plain, self.boxes[-1], inplace=True)
+            if self.masks is not None:
+                self.masks.update(self.plain[:, :, 0], lx, ly, x, y)
             self.height = max(self.height, new_h + z)
             return True
         return False
@@ -0,0 +1,101 @@
+import multiprocessing
+import random
+import queue
+import numpy as np
+from time import perf_counter
+from .binCreator import BoxCreator
+
+
+def _produce(creator, seq_queue, generated, seed):
+    # generator process: fill the queue with whole sequences, put() blocks while it is full
+    random.seed(seed)
+    np.random.seed(seed)
+    while True:
+        seq_queue.put(creator.sample_sequence())
+        with generated.get_lock():
+            generated.value += 1
+
+
+class SequenceProducer(object):
+    """
+    Generate box sequences in background processes into a bounded queue,
+    so that env resets don't wait for generation. The creator must provide
+    sample_sequence(), every worker runs its own copy with seed + rank.
+    """
+    def __init__(self, creator, workers=1, capacity=64, seed=0, context='fork'):
+        ctx = multiprocessing.get_context(context)
+        self.queue = ctx.Queue(maxsize=capacity)
+        self.generated = ctx.Value('l', 0)
+        self.consumed = ctx.Value('l', 0)
+        self.waited = ctx.Value('d', 0.0)
+        self.start_time = perf_counter()
+        self.procs = []
+        for rank in range(workers):
+            proc = ctx.Process(target=_produce, args=(creator, self.queue, self.generated, seed + rank))
+            proc.daemon = True
+            proc.start()
+            self.procs.append(proc)
+
+    def get(self):
+        # called by the consumers, possibly in other processes
+        try:
+            seq = self.queue.get_nowait()
+        except queue.Empty:
+            start = perf_counter()
+            seq = self.queue.get()
+            with self.waited.get_lock():
+                self.waited.value += perf_counter() - start
+        with self.consumed.get_lock():
+            self.consumed.value += 1
+        return seq
+
+    def stats(self):
+        elapsed = perf_counter() - self.start_time
+        return {'generated': self.generated.value, 'consumed': self.consumed.value,
+                'generation_rate': self.generated.value / elapsed,
+                'consumption_rate': self.consumed.value / elapsed,
+                'queue_size': self.queue.qsize(), 'consumer_wait': self.waited.value}
+
+    def close(self):
+        for proc in self.procs:
+            proc.terminate()
+        for proc in self.procs:
+            proc.join()
+
+    def __getstate__(self):
+        # consumers only need the queue and the counters
+        state = self.__dict__.copy()
+        state['procs'] = []
+        return state
+
+
+class StreamBoxCreator(BoxCreator):
+    """
+    Box creator fed by a SequenceProducer: every reset takes the next
+    generated sequence. The last box of a sequence (the generator's
+    sentinel) is repeated once the sequence runs out.
+    """
+    def __init__(self, producer):
+        super().__init__()
+        self.producer = producer
+        self.sequence = []
+        self.box_index = 0
+
+    def reset(self):
+        self.box_list.clear()
+        self.sequence = self.producer.get()
+        self.box_index = 0
+
+    def sample_sequence(self):
+        return self.producer.get()
+
+    def snapshot(self):
+        return super().snapshot(), self.box_index
+
+    def restore(self, state):
+        box_list, self.box_index = state
+        super().restore(box_list)
+
+    def generate_box_size(self, **kwargs):
+        self.box_list.append(self.sequence[min(self.box_index, len(self.sequence) - 1)])
+        self.box_index += 1
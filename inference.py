@@ -2,15 +2,18 @@
 
 from matplotlib import pyplot as plt
 from acktr.model_loader import nnModel
-from acktr.reorder import ReorderTree
+from acktr.reorder import ReorderTree, SearchPool
 from time import perf_counter
 from functools import reduce
 from math import gcd
 import numpy as np
 import copy
 import gym
-from unified_test import registration_envs
+from unified_test import registration_envs, report_workers
+import multiprocessing
 import random
+import torch
+import os
 
 class Box(object):
     """
@@ -35,6 +38,7 @@ class BppAgent(object):
         """
         self.args = args
         self.model = nnModel(args.load_dir + args.load_name, args)
+        self.pool = SearchPool(self.model, args.search_workers) if args.search_workers > 0 else None
         data_url = './dataset/' + args.data_name #TODO: use custom data
         self.env = gym.make(args.env_name,
                             box_set=args.box_size_set,
@@ -43,7 +47,8 @@ class BppAgent(object):
                             data_name=data_url,
                             enable_rotation=args.enable_rotation,
                             data_type=args.data_type,
-                            h_comp=args.h_comp)
+                            h_comp=args.h_comp,
+                            mask_cache=args.mask_cache)
         print('Env name: ', args.env_name)
         print('Data url: ', data_url)
         print('Model url: ', args.load_dir + args.load_name)
@@ -59,6 +64,12 @@ class BppAgent(object):
         self._flag_sequences = []     # record rotation information
         self._sequences = []
 
+    def close(self):
+        # stop the workers of the reorder search, if any
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
     @property
     def sequences(self):
         return self._sequences
@@ -68,17 +79,24 @@ class BppAgent(object):
         return self._flag_sequences
 
     def run_sequence(self, nmodel, raw_env, preview_num, **kwargs):
-        env = copy.deepcopy(raw_env)
+        env = raw_env.clone()
         obs = env.cur_observation
         default_counter = 0
         box_counter = 0
         start = perf_counter()
         sequence = []
         box_list = []
+        tree = None
         while True:
             box_list = env.box_creator.preview(preview_num)
-            tree = ReorderTree(nmodel, box_list, env, times=100)
-            act, val, default = tree.reorder_search()
+            if tree is None or not self.args.reuse_tree:
+                tree = ReorderTree(nmodel, box_list, env, times=self.args.search_times, pool=self.pool)
+            else:
+                tree.succeed(act, box_list, env)
+            if self.args.search_deadline > 0:
+                act, val, default, _ = tree.anytime_search(self.args.search_deadline)
+            else:
+                act, val, default = tree.reorder_search()
             obs, _, done, info = env.step([act])
 
             if done:
@@ -102,21 +120,40 @@ class BppAgent(object):
             box_counter += 1
             default_counter += int(default)
 
+    def simulate_case(self, index):
+        self.env.reset(index=index)
+        self.env.box_creator.preview(500)
+        return self.run_sequence(self.model, self.env, self.args.preview, real=False)
+
+    def simulate_parallel(self, times):
+        # every worker builds its own agent once, results are merged in case order
+        results, worker_stats = [], []
+        with multiprocessing.Pool(self.args.eval_workers, initializer=_init_agent_worker,
+                                  initargs=(self.args,)) as pool:
+            for (result, sequence, flags), pid, busy in pool.imap(_simulate_case, range(times)):
+                results.append(result)
+                self.sequences.append(sequence)
+                self.flag_sequences.append(flags)
+                worker_stats.append((pid, 1, result[1], busy))
+        report_workers(worker_stats)
+        return results
+
     def test_sim(self):
-        model = self.model
-        env = self.env
         args = self.args
 
         times = args.cases
         ratios = []
         avg_ratio, avg_counter, avg_time, avg_drate = 0.0, 0.0, 0.0, 0.0
-        for i in range(times):
-            # if i % 10 == 0:
-            #     print('case', i+1)
-            print('case', i+1)
-            env.reset()
-            env.box_creator.preview(500)
-            ratio, counter, time, depen_rate = self.run_sequence(model, env, args.preview, real=False)
+        if args.eval_workers > 0:
+            results = self.simulate_parallel(times)
+        else:
+            results = []
+            for i in range(times):
+                # if i % 10 == 0:
+                #     print('case', i+1)
+                print('case', i+1)
+                results.append(self.simulate_case(i))
+        for ratio, counter, time, depen_rate in results:
             avg_ratio += ratio
             ratios.append(ratio)
             avg_counter += counter
@@ -169,6 +206,24 @@ class BppAgent(object):
         print('----------------------------------------------')
 
 
+_agent = None
+
+
+def _init_agent_worker(args):
+    global _agent
+    # the workers already run in parallel, keep torch from oversubscribing the cores
+    torch.set_num_threads(1)
+    args = copy.copy(args)
+    args.search_workers = 0
+    _agent = BppAgent(args)
+
+
+def _simulate_case(index):
+    start = perf_counter()
+    result = _agent.simulate_case(index)
+    return (result, _agent.sequences[-1], _agent.flag_sequences[-1]), os.getpid(), perf_counter() - start
+
+
 if __name__ == "__main__":
 
     from acktr.arguments import get_args
@@ -183,6 +238,7 @@ if __name__ == "__main__":
         tester.test_sim()
     else:
         tester.test_real()
+    tester.close()
 
     sequences = tester.sequences
 
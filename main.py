@@ -6,10 +6,12 @@ import numpy as np
 import torch
 from shutil import copyfile
 from acktr import algo, utils
-from acktr.utils import get_possible_position, get_rotation_mask
+from acktr.utils import get_location_masks
 from acktr.envs import make_vec_envs
 from acktr.arguments import get_args
 from acktr.model import Policy
+from envs.bpp0.bin3D import make_box_creator
+from envs.bpp0.streamCreator import SequenceProducer
 from acktr.storage import RolloutStorage
 from evaluation import evaluate
 from tensorboardX import SummaryWriter
@@ -63,7 +65,13 @@ def train_model(args):
 
     torch.set_num_threads(1)
     device = torch.device(args.device)
-    envs = make_vec_envs(env_name, args.seed, args.num_processes, args.gamma, log_dir, device, False, args = args)
+    producer = None
+    if args.seq_producers > 0:
+        # generate the training sequences in background processes
+        creator = make_box_creator(args.data_type, args.container_size, args.box_size_set, args.enable_rotation)
+        producer = SequenceProducer(creator, args.seq_producers, args.seq_queue, args.seed)
+    envs = make_vec_envs(env_name, args.seed, args.num_processes, args.gamma, log_dir, device, False, args = args,
+                         worker_masks = args.worker_masks, producer = producer, batched = args.batched_env)
 
     if args.load_model:
         model_pretrained, ob_rms = torch.load(os.path.join(load_path, args.load_name))
@@ -123,14 +131,12 @@ def train_model(args):
                               pallet_size=args.container_size[0])
 
     obs = envs.reset()
-    location_masks = []
-    for observation in obs:
-        if not args.enable_rotation:
-            box_mask = get_possible_position(observation, args.container_size)
-        else:
-            box_mask = get_rotation_mask(observation, args.container_size)
-        location_masks.append(box_mask)
-    location_masks = torch.FloatTensor(location_masks).to(device)
+    # the batched env computes the masks of all its bins in one call
+    env_masks = args.worker_masks or args.batched_env
+    if env_masks:
+        location_masks = envs.get_masks()
+    else:
+        location_masks = get_location_masks(obs, args.container_size, args.enable_rotation)
 
     rollouts.obs[0].copy_(obs)
     rollouts.location_masks[0].copy_(location_masks)
@@ -158,19 +164,15 @@ def train_model(args):
                     rollouts.obs[step], rollouts.recurrent_hidden_states[step],
                     rollouts.masks[step], location_masks)
 
-            location_masks = []
             obs, reward, done, infos = envs.step(action)
             for i in range(len(infos)):
                 if 'episode' in infos[i].keys():
                     episode_rewards.append(infos[i]['episode']['r'])
                     episode_ratio.append(infos[i]['ratio'])
-            for observation in obs:
-                if not args.enable_rotation:
-                    box_mask = get_possible_position(observation, args.container_size)
-                else:
-                    box_mask = get_rotation_mask(observation, args.container_size)
-                location_masks.append(box_mask)
-            location_masks = torch.FloatTensor(location_masks).to(device)
+            if env_masks:
+                location_masks = envs.get_masks()
+            else:
+                location_masks = get_location_masks(obs, args.container_size, args.enable_rotation)
 
             # If done then clean the history of observations.
             masks = torch.FloatTensor([[0.0] if done_ else [1.0] for done_ in done])
@@ -213,6 +215,11 @@ def train_model(args):
                             np.median(episode_rewards), np.min(episode_rewards),
                             np.max(episode_rewards), dist_entropy, value_loss,
                             action_loss, np.mean(episode_ratio)))
+            if producer is not None:
+                stats = producer.stats()
+                print("Sequences generated/consumed per second {:.1f}/{:.1f}, queued {}, resets waited {:.1f}s\n"
+                      .format(stats['generation_rate'], stats['consumption_rate'],
+                              stats['queue_size'], stats['consumer_wait']))
 
             if args.tensorboard:
                 writer.add_scalar('The average rewards', np.mean(episode_rewards), j)
@@ -1,9 +1,10 @@
 import sys 
 sys.path.append("..")
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import gym
 from acktr.model_loader import nnModel
-from acktr.utils import check_box, get_possible_position
+from envs.bpp0.feasibility import position_mask
 from acktr.arguments import get_args
 from gym.envs.registration import register
 
@@ -19,6 +20,22 @@ def slipingWindow(plain, new_plain_size, stride=10):
             new_plain = plain[i : i + x_np, j:j + y_np]
             yield new_plain, i, j
 
+def window_masks(plain, box_size, new_plain_size, stride=10):
+    """
+    The batch_action_masks of every slipingWindow window from one
+    position_mask over the whole plain. The rule only looks inside the
+    footprint, so a window's mask is its crop of the plain's mask without
+    the positions where the box sticks out of the window.
+    """
+    x, y, z = int(box_size[0]), int(box_size[1]), int(box_size[2])
+    mask = position_mask(plain, x, y, z, new_plain_size[2], strict_corners=False)
+    masks = sliding_window_view(mask, new_plain_size[:2])[::stride, ::stride].copy()
+    masks[:, :, new_plain_size[0] - x + 1:] = 0
+    masks[:, :, :, new_plain_size[1] - y + 1:] = 0
+    masks = masks.reshape((-1, new_plain_size[0] * new_plain_size[1]))
+    masks[masks.sum(axis=1) == 0] = 1
+    return masks
+
 def decode(env, obs):
     action_space = env.space.get_action_space()
     plain = np.reshape(obs[:action_space],newshape=env.space.plain_size[:2])
@@ -28,7 +45,7 @@ def decode(env, obs):
 def get_action(env, obs, nmodel, past_rewards, evaluations):
     plain, box_size = decode(env, obs)
     new_plain_size = args.container_size
-    psw = slipingWindow(plain, new_plain_size)
+    psw = slipingWindow(plain, new_plain_size, args.window_stride)
     bin_num = (plain.shape[0]*plain.shape[1])/(new_plain_size[0]*new_plain_size[1])
 
     max_adv = -1e8
@@ -37,17 +54,22 @@ def get_action(env, obs, nmodel, past_rewards, evaluations):
     new_value = None
     # print('------------------')
 
-    for new_plain, dx, dy in psw:
-        aspace = new_plain_size[0] * new_plain_size[1]
-        ppp = np.reshape(new_plain, newshape=(-1,))
-        new_obs = np.zeros(shape=(400,))
-        new_obs[0*aspace:1*aspace] = ppp
-        new_obs[1*aspace:2*aspace] = box_size[0]
-        new_obs[2*aspace:3*aspace] = box_size[1]
-        new_obs[3*aspace:4*aspace] = box_size[2]
-
-        value, poss  = nmodel.evaluate(new_obs, False)
-        mask = get_possible_position(new_obs, args.container_size)
+    # gather all windows and evaluate them in one forward pass
+    aspace = new_plain_size[0] * new_plain_size[1]
+    windows = list(psw)
+    plains = np.array([new_plain for new_plain, _, _ in windows])
+    obs_batch = np.zeros(shape=(len(windows), 4*aspace))
+    obs_batch[:, 0*aspace:1*aspace] = plains.reshape((len(windows), -1))
+    obs_batch[:, 1*aspace:2*aspace] = box_size[0]
+    obs_batch[:, 2*aspace:3*aspace] = box_size[1]
+    obs_batch[:, 3*aspace:4*aspace] = box_size[2]
+
+    values, poss_batch, _ = nmodel.evaluate_batch(obs_batch, False)
+    # the masks of all windows from one mask over the whole plain
+    masks = window_masks(plain, box_size, args.container_size, args.window_stride)
+
+    for (new_plain, dx, dy), value, poss, mask in zip(windows, values, poss_batch, masks):
+        value = float(value)
         poss = poss * mask
         if np.sum(mask) == len(mask):
             continue
@@ -124,7 +146,8 @@ if __name__ == '__main__':
     env = gym.make(args.env_name,
                    box_set=args.box_size_set,
                    container_size=container_size, test=True,
-                   data_name=data_url, data_type=args.data_type)
+                   data_name=data_url, data_type=args.data_type,
+                   mask_cache=args.mask_cache)
     
     ratio = 0.0
     num = 0.0
@@ -0,0 +1,56 @@
+import random
+import numpy as np
+import pytest
+from acktr.reorder import ReorderTree
+from envs.bpp0 import PackingGame
+from envs.bpp0.feasibility import get_action_mask
+
+CONTAINER = (10, 10, 10)
+
+
+class HeightModel(object):
+    """
+    Deterministic stand-in for nnModel: prefers the lowest feasible position
+    and values a state by how many positions stay feasible for its box.
+    """
+    def evaluate_batch(self, observations, use_mask=True):
+        area = CONTAINER[0] * CONTAINER[1]
+        vals, poss = [], []
+        for obs in np.asarray(observations, dtype=np.float64):
+            hmap = obs[:area].reshape(CONTAINER[:2])
+            box = obs[area::area][:3]
+            mask = get_action_mask(hmap, box, CONTAINER[2], strict_corners=False)
+            vals.append(mask.sum() / area)
+            poss.append(mask * np.exp(-hmap.reshape(-1) / CONTAINER[2]) + 1e-6)
+        return np.array(vals), np.array(poss), None
+
+
+def make_env(seed):
+    random.seed(seed)
+    np.random.seed(seed)
+    box_set = [(i, j, k) for i in range(2, 6) for j in range(2, 6) for k in range(2, 6)]
+    env = PackingGame(container_size=CONTAINER, box_set=box_set, data_type='cut2')
+    env.reset()
+    return env
+
+
+@pytest.mark.parametrize("preview,times", [(3, 2), (4, 6), (5, 10)])
+def test_reuse_not_worse_than_fresh(preview, times):
+    # a reused tree gets the same simulations as a fresh one, its best value must not be lower at any step
+    model = HeightModel()
+    for seed in range(3):
+        env = make_env(seed)
+        tree = None
+        while True:
+            box_list = env.box_creator.preview(preview)
+            if tree is None:
+                tree = ReorderTree(model, box_list, env, times=times)
+            else:
+                tree.succeed(act, box_list, env)
+            act, _, _ = tree.reorder_search()
+            fresh = ReorderTree(model, box_list, env, times=times)
+            fresh.reorder_search()
+            assert tree.root.max_value >= fresh.root.max_value - 1e-6
+            _, _, done, _ = env.step([act])
+            if done:
+                break
@@ -1,56 +1,142 @@
 from time import perf_counter
+from collections import OrderedDict
+import multiprocessing
+import os
+import torch
 from acktr.model_loader import nnModel
-from acktr.reorder import ReorderTree
+from acktr.reorder import ReorderTree, SearchPool, run_lockstep
 import gym
-import copy
 from gym.envs.registration import register
 from acktr.arguments import get_args
 
-def run_sequence(nmodel, raw_env, preview_num, c_bound):
-    env = copy.deepcopy(raw_env)
+def run_sequence(nmodel, raw_env, preview_num, c_bound, times=100, reuse_tree=False, pool=None, deadline=0):
+    return run_lockstep(nmodel, [sequence_steps(nmodel, raw_env, preview_num, times, reuse_tree, pool, deadline)])[0]
+
+def run_batch(nmodel, raw_envs, preview_num, c_bound, times=100, reuse_tree=False, pool=None, deadline=0):
+    # run the sequences in lockstep, their network queries are batched into one forward pass per round
+    steps = [sequence_steps(nmodel, raw_env, preview_num, times, reuse_tree, pool, deadline) for raw_env in raw_envs]
+    return run_lockstep(nmodel, steps)
+
+def sequence_steps(nmodel, raw_env, preview_num, times=100, reuse_tree=False, pool=None, deadline=0):
+    # search generator of a whole sequence, see ReorderTree.search_steps
+    env = raw_env.clone()
     obs = env.cur_observation
     default_counter = 0
     box_counter = 0
+    sim_counter = 0
     start = perf_counter()
+    tree = None
     while True:
         box_list = env.box_creator.preview(preview_num)
         # print(box_list)
-        tree = ReorderTree(nmodel, box_list, env, times=100)
-        act, val, default = tree.reorder_search()
+        if tree is None or not reuse_tree:
+            tree = ReorderTree(nmodel, box_list, env, times=times, pool=pool)
+        else:
+            tree.succeed(act, box_list, env)
+        if deadline > 0:
+            act, val, default, telemetry = yield from tree.anytime_steps(deadline)
+            sim_counter += telemetry['simulations']
+        else:
+            act, val, default = yield from tree.search_steps(tree.times)
         obs, _, done, info = env.step([act])
         if done:
             end = perf_counter()
             print('Time cost:', end-start)
             print('Ratio:', info['ratio'])
+            if deadline > 0:
+                print('Simulations per item:', sim_counter / (box_counter + 1))
             return info['ratio'], info['counter'], end-start,default_counter/box_counter
         box_counter += 1
         default_counter += int(default)
 
-def unified_test(url, args, pruning_threshold = 0.5):
-    nmodel = nnModel(url, args)
-    data_url = './dataset/' +args.data_name
-    env = gym.make(args.env_name,
+def make_env(args, data_url):
+    return gym.make(args.env_name,
                     box_set=args.box_size_set,
                     container_size=args.container_size,
                     test=True, data_name=data_url,
                     enable_rotation=args.enable_rotation,
-                    data_type=args.data_type)
+                    data_type=args.data_type,
+                    mask_cache=args.mask_cache)
+
+def evaluate_cases(nmodel, env, indices, args, c_bound, pool=None):
+    # run the cases in lockstep, each one starts from its sequence of the dataset
+    raw_envs = []
+    for j in indices:
+        if j % 10 == 0:
+            print('case', j+1)
+        env.reset(index=j)
+        env.box_creator.preview(500)
+        raw_envs.append(env.clone())
+    start = perf_counter()
+    results = run_batch(nmodel, raw_envs, args.preview, c_bound,
+                        args.search_times, args.reuse_tree, pool, args.search_deadline)
+    # sequences of a batch run side by side, so they share its wall time
+    time = (perf_counter() - start) / len(raw_envs)
+    return [(ratio, counter, time, depen_rate) for ratio, counter, _, depen_rate in results]
+
+_eval_worker = None
+
+def _init_eval_worker(url, args, data_url, c_bound):
+    global _eval_worker
+    # the workers already run in parallel, keep torch from oversubscribing the cores
+    torch.set_num_threads(1)
+    # the env registration is inherited from the forked parent
+    _eval_worker = (nnModel(url, args), make_env(args, data_url), args, c_bound)
+
+def _evaluate_chunk(indices):
+    nmodel, env, args, c_bound = _eval_worker
+    start = perf_counter()
+    results = evaluate_cases(nmodel, env, indices, args, c_bound)
+    return results, os.getpid(), perf_counter() - start
+
+def report_workers(worker_stats):
+    # worker_stats: (pid, case number, item number, busy time) of every finished chunk
+    workers = OrderedDict()
+    for pid, cases, items, busy in worker_stats:
+        total = workers.setdefault(pid, [0, 0, 0.0])
+        total[0] += cases
+        total[1] += items
+        total[2] += busy
+    for k, (pid, (cases, items, busy)) in enumerate(workers.items()):
+        print('worker %d (pid %d): %d cases, %d items, %.2f items/s' % (k, pid, cases, items, items / busy))
+
+def unified_test(url, args, pruning_threshold = 0.5):
+    data_url = './dataset/' +args.data_name
     print('Env name: ', args.env_name)
     print('Data url: ', data_url)
     print('Model url: ', url)
     print('Case number: ', args.cases)
     print('pruning threshold: ', pruning_threshold)
     print('Known item number: ', args.preview)
+    print('Search times: ', args.search_times, '(tree reused)' if args.reuse_tree else '')
+    print('Search workers: ', args.search_workers)
+    if args.search_deadline > 0:
+        print('Search deadline (ms): ', args.search_deadline)
+    print('Sequences per batch: ', args.eval_batch)
+    print('Evaluation workers: ', args.eval_workers)
     times = args.cases
     ratios = []
     avg_ratio, avg_counter, avg_time, avg_drate = 0.0, 0.0, 0.0, 0.0
     c_bound = pruning_threshold
-    for i in range(times):
-        if i % 10 == 0:
-            print('case', i+1)
-        env.reset()
-        env.box_creator.preview(500)
-        ratio, counter, time, depen_rate = run_sequence(nmodel, env, args.preview, c_bound)
+    chunks = [list(range(i, min(i + args.eval_batch, times))) for i in range(0, times, args.eval_batch)]
+    nmodel, pool = None, None
+    if args.eval_workers > 0:
+        # every worker loads the model and the dataset once, results come back in case order
+        worker_stats = []
+        with multiprocessing.Pool(args.eval_workers, initializer=_init_eval_worker,
+                                  initargs=(url, args, data_url, c_bound)) as eval_pool:
+            all_results = []
+            for results, pid, busy in eval_pool.imap(_evaluate_chunk, chunks):
+                all_results.extend(results)
+                worker_stats.append((pid, len(results), sum(r[1] for r in results), busy))
+    else:
+        nmodel = nnModel(url, args)
+        pool = SearchPool(nmodel, args.search_workers) if args.search_workers > 0 else None
+        env = make_env(args, data_url)
+        all_results = []
+        for indices in chunks:
+            all_results.extend(evaluate_cases(nmodel, env, indices, args, c_bound, pool))
+    for ratio, counter, time, depen_rate in all_results:
         avg_ratio += ratio
         ratios.append(ratio)
         avg_counter += counter
@@ -65,6 +151,12 @@ def unified_test(url, args, pruning_threshold = 0.5):
     print('average sequence time: %.4f'%(avg_time/times))
     print('average time per item: %.4f'%(avg_time/avg_counter))
     print('----------------------------------------------')
+    if args.eval_workers > 0:
+        report_workers(worker_stats)
+    if pool is not None:
+        pool.close()
+    if nmodel is not None and nmodel.cache is not None:
+        print('evaluation cache: ', nmodel.cache.stats())
 
 def registration_envs():
     register(